@@ -6,7 +6,6 @@ eventlet.monkey_patch()
 import os
 import sys
 import signal
-import atexit
 import importlib.util
 import socket
 
@@ -20,16 +19,24 @@ if APP_DIR not in sys.path:
     sys.path.insert(0, APP_DIR)
 
 from app import create_app, db, socketio
+from app.workers import drain_worker
 
 app = create_app()
 
-def cleanup_on_exit(*args):
-    print("\n[server] Shutting down gracefully...")
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "30"))
 
-# Register cleanup handlers
-signal.signal(signal.SIGINT, cleanup_on_exit)
-signal.signal(signal.SIGTERM, cleanup_on_exit)
-atexit.register(cleanup_on_exit)
+def drain_on_exit(*args):
+    """Stop accepting, disconnect Socket.IO clients and let in-flight requests finish"""
+    print("\n[server] Shutting down gracefully...")
+    signal.signal(signal.SIGINT, signal.SIG_DFL)    # a second Ctrl+C quits at once
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    eventlet.spawn(drain_worker)
+    eventlet.spawn_after(DRAIN_TIMEOUT, os._exit, 0)
+    # the wsgi server stops accepting on SystemExit and waits for its requests
+    raise SystemExit
+
+signal.signal(signal.SIGINT, drain_on_exit)
+signal.signal(signal.SIGTERM, drain_on_exit)
 
 if __name__ == "__main__":
     with app.app_context():
@@ -1,8 +1,10 @@
 from flask import Flask, redirect, url_for
+from jinja2 import FileSystemBytecodeCache
 from flask_sqlalchemy import SQLAlchemy
 from flask_socketio import SocketIO
 from flask_login import LoginManager
 import os
+from .logger import setup_logging
 
 db = SQLAlchemy()
 socketio = SocketIO(cors_allowed_origins="*", message_queue=os.getenv("REDIS_URL", "redis://localhost:6379/0"))
@@ -13,16 +15,42 @@ def create_app():
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///secure_transfer.db'
     app.config['UPLOAD_FOLDER'] = os.path.join(os.getcwd(), 'uploads')
     app.config['REDIS_URL'] = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    # encrypt every new session's uploads at rest (sessions can also opt in individually)
+    app.config['AT_REST_ENCRYPTION'] = os.getenv("AT_REST_ENCRYPTION", "0") == "1"
+    # storage quotas in bytes, 0 = unlimited
+    app.config['SESSION_QUOTA_BYTES'] = int(os.getenv("SESSION_QUOTA_BYTES", 5 * 1024 ** 3))
+    app.config['USER_QUOTA_BYTES'] = int(os.getenv("USER_QUOTA_BYTES", 20 * 1024 ** 3))
+    # most files a single folder upload may contain
+    app.config['FOLDER_UPLOAD_MAX_FILES'] = int(os.getenv("FOLDER_UPLOAD_MAX_FILES", 50000))
+    # accounts allowed into /admin (comma separated emails)
+    app.config['ADMIN_EMAILS'] = {e.strip() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+    # runtime profiling, switched on from /admin/profiling
+    app.config['PROFILING_SLOW_MS'] = int(os.getenv("PROFILING_SLOW_MS", 1000))
+    app.config['PROFILING_SAMPLE_HZ'] = int(os.getenv("PROFILING_SAMPLE_HZ", 100))
+    app.config['HUB_BLOCK_MS'] = int(os.getenv("HUB_BLOCK_MS", 200))
+    # memory per worker for caching hot download chunks, 0 = off
+    app.config['READ_CACHE_BYTES'] = int(os.getenv("READ_CACHE_BYTES", 256 * 1024 ** 2))
 
     db.init_app(app)
     socketio.init_app(app)
+    setup_logging(app)
+
+    # compiled templates are cached on disk so fresh workers skip recompiling them
+    jinja_cache = os.path.join(app.instance_path, 'jinja_cache')
+    os.makedirs(jinja_cache, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(jinja_cache)
 
     # ✅ sabhi blueprints register karo
-    from . import models, auth, lan_transfer, online_transfer, main
+    from . import models, auth, lan_transfer, online_transfer, main, workers, assets, profiling, read_cache
     app.register_blueprint(auth.auth_bp)
     app.register_blueprint(lan_transfer.lan_bp)
     app.register_blueprint(online_transfer.bp)
     app.register_blueprint(main.main_bp)   # ✅ ye missing tha
+    app.register_blueprint(workers.workers_bp)
+    app.register_blueprint(assets.assets_bp)
+    app.register_blueprint(profiling.profiling_bp)
+    assets.init_app(app)
+    read_cache.init_app(app)
 
     login_manager = LoginManager()
     login_manager.login_view = 'auth.login'
@@ -31,7 +59,8 @@ def create_app():
     from .models import User
     @login_manager.user_loader
     def load_user(id):
-        return User.query.get(int(id))
+        with profiling.phase('auth'):
+            return User.query.get(int(id))
 
     @app.route('/')
     def index():
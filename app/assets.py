@@ -0,0 +1,114 @@
+# app/assets.py
+"""
+Static asset pipeline.
+
+Sources live in app/static_src. At startup every bundle below is concatenated,
+named after a hash of its contents (online_dashboard.3f9c1a2b7d.js) and
+written to app/static/dist along with .gz and, when the `brotli` package is
+installed, .br variants. Templates link bundles with asset_url(name); since a
+name changes whenever its contents do, responses are cached forever and the
+precompressed variant matching Accept-Encoding is sent as-is.
+"""
+from flask import Blueprint, current_app, request, send_from_directory, url_for, abort
+import os, re, gzip, hashlib, mimetypes
+
+try:
+    import brotli
+except ImportError:   # optional, gzip is always available
+    brotli = None
+
+assets_bp = Blueprint('assets', __name__, url_prefix='/assets')
+
+BUNDLES = {
+    'socket.io.js': ['vendor/socket.io-4.8.1.min.js'],
+    'dashboard.css': ['css/dashboard.css'],
+    'dashboard.js': ['js/dashboard.js'],
+    'login.css': ['css/login.css'],
+    'signup.css': ['css/signup.css'],
+    'stars.js': ['js/stars.js'],
+    'online_dashboard.css': ['css/online_dashboard.css'],
+    'online_dashboard.js': ['js/online_dashboard.js'],
+}
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+MANIFEST = {}   # bundle name -> fingerprinted file name
+
+
+def _write(path, data):
+    """Write atomically so workers building at the same time never serve half a file"""
+    if os.path.exists(path):
+        return
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+
+
+def build(src_dir, out_dir):
+    """Build every bundle into out_dir and return the manifest"""
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {}
+    for name, parts in BUNDLES.items():
+        chunks = []
+        for part in parts:
+            with open(os.path.join(src_dir, part), 'rb') as fh:
+                chunks.append(fh.read())
+        data = b'\n'.join(chunks)
+        stem, ext = os.path.splitext(name)
+        digest = hashlib.sha256(data).hexdigest()[:10]
+        fingerprinted = f"{stem}.{digest}{ext}"
+        path = os.path.join(out_dir, fingerprinted)
+
+        _write(path, data)
+        _write(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli:
+            _write(path + '.br', brotli.compress(data, quality=11))
+
+        # drop outputs from older builds of this bundle
+        previous = re.compile(re.escape(stem) + r'\.([0-9a-f]{10})' + re.escape(ext) + r'(\.gz|\.br)?')
+        for old in os.listdir(out_dir):
+            match = previous.fullmatch(old)
+            if match and match.group(1) != digest:
+                try:
+                    os.remove(os.path.join(out_dir, old))
+                except FileNotFoundError:
+                    pass
+        manifest[name] = fingerprinted
+    return manifest
+
+
+def asset_url(name):
+    return url_for('assets.bundle', filename=MANIFEST[name])
+
+
+def init_app(app):
+    src_dir = os.path.join(app.root_path, 'static_src')
+    out_dir = os.path.join(app.root_path, 'static', 'dist')
+    MANIFEST.update(build(src_dir, out_dir))
+    app.config['ASSETS_DIR'] = out_dir
+    app.jinja_env.globals['asset_url'] = asset_url
+
+
+@assets_bp.route('/<path:filename>')
+def bundle(filename):
+    """Serve a fingerprinted bundle, preferring a precompressed variant"""
+    if filename not in MANIFEST.values():
+        abort(404)
+    out_dir = current_app.config['ASSETS_DIR']
+    accepted = request.accept_encodings
+
+    encoding = None
+    for enc, ext in (('br', '.br'), ('gzip', '.gz')):
+        if accepted[enc] and os.path.exists(os.path.join(out_dir, filename + ext)):
+            encoding = enc
+            break
+
+    mimetype = mimetypes.guess_type(filename)[0]
+    served = filename + ('.br' if encoding == 'br' else '.gz' if encoding else '')
+    resp = send_from_directory(out_dir, served, mimetype=mimetype)
+    if encoding:
+        resp.headers['Content-Encoding'] = encoding
+    resp.headers['Cache-Control'] = IMMUTABLE
+    resp.headers['Vary'] = 'Accept-Encoding'
+    return resp
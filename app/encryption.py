@@ -0,0 +1,154 @@
+# app/encryption.py
+"""
+Chunked at-rest encryption for session uploads.
+
+Encrypted files start with a 16 byte header (magic, chunk size, nonce prefix)
+followed by records of up to CHUNK_SIZE plaintext bytes, each sealed with
+AES-256-GCM (ciphertext + 16 byte tag). Every record is authenticated against
+the header, its index and whether it is the final record, so records can't be
+reordered, swapped between files or truncated away. Because records have a
+fixed size, a byte range maps straight to the records that cover it and can be
+decrypted without touching the rest of the file.
+"""
+import os, math, struct
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.exceptions import InvalidTag
+
+from app.read_cache import CachedFile, send_range
+from app.utils import atomic_write
+
+MAGIC = b'SNE1'
+CHUNK_SIZE = 64 * 1024
+TAG_SIZE = 16
+HEADER = struct.Struct('>4sI8s')   # magic, chunk size, nonce prefix
+
+
+class EncryptedFileError(Exception):
+    """Raised when an encrypted file is malformed or fails authentication."""
+
+
+def generate_key():
+    """Return a fresh 256-bit session key."""
+    return AESGCM.generate_key(bit_length=256)
+
+
+def _nonce(prefix, index):
+    return prefix + struct.pack('>I', index)
+
+
+def _aad(header, index, final):
+    return header + struct.pack('>IB', index, 1 if final else 0)
+
+
+def _read_block(src, size):
+    """Read exactly `size` bytes from `src` unless it runs dry first."""
+    buf = src.read(size)
+    while buf and len(buf) < size:
+        more = src.read(size - len(buf))
+        if not more:
+            break
+        buf += more
+    return buf
+
+
+def encrypt_stream(src, dst_path, key, chunk_size=CHUNK_SIZE):
+    """
+    Read plaintext from file-like `src` and write it encrypted to `dst_path`.
+    Only one record is held in memory at a time. The file is written to a
+    temporary name and moved into place once complete.
+    Returns the number of plaintext bytes written.
+    """
+    aes = AESGCM(key)
+    header = HEADER.pack(MAGIC, chunk_size, os.urandom(8))
+    prefix = header[8:]
+    total = 0
+    with atomic_write(dst_path) as out:
+        out.write(header)
+        index = 0
+        block = _read_block(src, chunk_size)
+        while True:
+            # read one block ahead so the last record can be flagged final
+            nxt = _read_block(src, chunk_size) if len(block) == chunk_size else b''
+            final = not nxt
+            out.write(aes.encrypt(_nonce(prefix, index), block, _aad(header, index, final)))
+            total += len(block)
+            if final:
+                break
+            block = nxt
+            index += 1
+    return total
+
+
+def encrypted_size(n, chunk_size=CHUNK_SIZE):
+    """On-disk size of `n` plaintext bytes once encrypted."""
+    return HEADER.size + max(math.ceil(n / chunk_size), 1) * TAG_SIZE + n
+
+
+def _layout(fh):
+    """Return (header, chunk_size, record_count, plaintext_size) for an open encrypted file."""
+    fh.seek(0)
+    header = fh.read(HEADER.size)
+    if len(header) != HEADER.size:
+        raise EncryptedFileError("truncated header")
+    magic, chunk_size, _ = HEADER.unpack(header)
+    if magic != MAGIC or not chunk_size:
+        raise EncryptedFileError("not an encrypted session file")
+    body = os.fstat(fh.fileno()).st_size - HEADER.size
+    if body < TAG_SIZE:
+        raise EncryptedFileError("truncated body")
+    records = math.ceil(body / (chunk_size + TAG_SIZE))
+    return header, chunk_size, records, body - records * TAG_SIZE
+
+
+def plaintext_size(path):
+    """Size of the decrypted contents of `path`."""
+    with open(path, 'rb') as fh:
+        return _layout(fh)[3]
+
+
+def _decrypt_range(fh, key, start, stop):
+    """Yield decrypted bytes of [start, stop) from an open encrypted file."""
+    aes = AESGCM(key)
+    header, chunk_size, records, size = _layout(fh)
+    prefix = header[8:]
+    stop = size if stop is None else min(stop, size)
+    if start >= stop:
+        return
+    record_size = chunk_size + TAG_SIZE
+    for index in range(start // chunk_size, (stop - 1) // chunk_size + 1):
+        offset = HEADER.size + index * record_size
+        fh.seek(offset)
+        record = fh.read(record_size)
+        try:
+            block = aes.decrypt(_nonce(prefix, index), record,
+                                _aad(header, index, index == records - 1))
+        except InvalidTag:
+            raise EncryptedFileError(f"record {index} failed authentication")
+        base = index * chunk_size
+        yield block[max(start - base, 0):stop - base]
+
+
+def iter_decrypted(path, key, start=0, stop=None):
+    """
+    Yield decrypted bytes of `path` in the half-open range [start, stop).
+    Only the records overlapping the range are read and decrypted.
+    """
+    with open(path, 'rb') as fh:
+        yield from _decrypt_range(fh, key, start, stop)
+
+
+def send_encrypted_file(path, key, download_name):
+    """
+    Stream a decrypted file as an attachment, honouring single byte-range
+    requests so downloads can resume or seek without decrypting everything.
+    Ciphertext is read through the shared read cache.
+    """
+    fh = CachedFile(path)
+    try:
+        size = _layout(fh)[3]
+    except Exception:
+        fh.close()
+        raise
+    resp = send_range(fh, size, lambda start, stop: _decrypt_range(fh, key, start, stop), download_name)
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
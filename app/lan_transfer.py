@@ -1,8 +1,14 @@
 # app/lan_transfer.py
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_from_directory, jsonify, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from flask_login import login_required, current_user, logout_user
 import os, random, socket, shutil
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
+from app.encryption import generate_key, encrypt_stream, send_encrypted_file
+from app import quota
+from app.read_cache import CACHE, send_cached_file
+from app.profiling import phase
+from app.utils import stored_files
 
 lan_bp = Blueprint('lan', __name__, url_prefix='/lan')
 
@@ -13,7 +19,9 @@ ACTIVE_SESSIONS = {
     # 'username': 'sender_name',
     # 'password': 'secretpass',
     # 'folder': '/abs/path/to/uploads/session_123456',
-    # 'owner': current_user.id
+    # 'owner': current_user.id,
+    # 'enc_key': b'...'   (only when at-rest encryption is on)
+    # 'used': 0           (bytes stored, checked against SESSION_QUOTA_BYTES)
 }
 BASE_UPLOAD_DIR = None
 
@@ -40,6 +48,36 @@ def get_local_ip():
     return ip
 
 
+# LAN usage lives in ACTIVE_SESSIONS next to the session itself, so LAN mode
+# keeps working on isolated networks without Redis
+def reserve_storage(nbytes):
+    """Reserve `nbytes` in the active session, or raise quota.QuotaExceeded"""
+    limit = quota.limits()[0]
+    used = ACTIVE_SESSIONS.get('used', 0)
+    if limit and used + nbytes > limit:
+        raise quota.QuotaExceeded('session', limit - used)
+    ACTIVE_SESSIONS['used'] = used + nbytes
+
+
+def settle_storage(otp, reserved, used):
+    """Replace a reservation with the bytes actually stored, unless session `otp` has ended since"""
+    if ACTIVE_SESSIONS.get('otp') == otp:
+        ACTIVE_SESSIONS['used'] = ACTIVE_SESSIONS.get('used', 0) + used - reserved
+
+
+def storage_usage():
+    """Same shape as quota.usage() for the panel"""
+    limit = quota.limits()[0]
+    used = ACTIVE_SESSIONS.get('used', 0)
+    return {
+        'session_used': used,
+        'session_limit': limit,
+        'user_used': 0,
+        'user_limit': 0,
+        'remaining': max(limit - used, 0) if limit else None,
+    }
+
+
 def clear_folder(path):
     """Safely remove a folder and everything inside it"""
     try:
@@ -66,6 +104,7 @@ def create_session():
     if request.method == 'POST':
         username = (request.form.get('username') or "").strip()
         password = (request.form.get('password') or "").strip()
+        encrypt = bool(request.form.get('encrypt')) or current_app.config.get('AT_REST_ENCRYPTION', False)
 
         if not username or not password:
             flash("Please provide username and password to create a session.", "warning")
@@ -91,8 +130,11 @@ def create_session():
             "username": username,
             "password": password,
             "folder": session_folder,
-            "owner": current_user.get_id()  # record owner id for safety
+            "owner": current_user.get_id(),  # record owner id for safety
+            "used": 0,
         })
+        if encrypt:
+            ACTIVE_SESSIONS["enc_key"] = generate_key()
 
         ip = get_local_ip()
         flash("LAN Session created successfully! Share the receiver link and OTP.", "success")
@@ -105,6 +147,7 @@ def create_session():
         print(f"Password: {password}")
         print(f"OTP: {otp}")
         print(f"Session folder: {session_folder}")
+        print(f"Encrypted at rest: {'yes' if encrypt else 'no'}")
         print("=================================\n")
 
         return redirect(url_for('lan.panel'))
@@ -163,8 +206,9 @@ def panel():
     folder = ACTIVE_SESSIONS.get('folder')
     files = []
     if folder and os.path.exists(folder):
-        files = sorted(os.listdir(folder))
-    return render_template('lan_panel.html', files=files, session_info=ACTIVE_SESSIONS)
+        files = stored_files(folder)
+    storage = storage_usage()
+    return render_template('lan_panel.html', files=files, session_info=ACTIVE_SESSIONS, storage=storage)
 
 
 @lan_bp.route('/upload', methods=['POST'])
@@ -178,18 +222,42 @@ def upload_file():
         flash("No active session to upload to.", "error")
         return redirect(url_for('lan.join_session'))
 
-    if 'file' not in request.files:
-        flash('No file selected.', 'error')
+    # check quota before touching request.files, which would read the whole body
+    if request.content_length is None:
+        flash("Upload size unknown, please retry.", "error")
         return redirect(url_for('lan.panel'))
-
-    f = request.files['file']
-    if not f or f.filename == '':
-        flash('No file selected.', 'error')
+    otp = ACTIVE_SESSIONS.get('otp')
+    reserved = quota.upload_reservation(encrypted='enc_key' in ACTIVE_SESSIONS)
+    try:
+        reserve_storage(reserved)
+    except quota.QuotaExceeded:
+        flash("Not enough storage left in this session for that file.", "error")
         return redirect(url_for('lan.panel'))
 
-    filename = secure_filename(f.filename)
-    save_path = os.path.join(folder, filename)
-    f.save(save_path)
+    used = 0
+    try:
+        if 'file' not in request.files:
+            flash('No file selected.', 'error')
+            return redirect(url_for('lan.panel'))
+
+        f = request.files['file']
+        if not f or f.filename == '':
+            flash('No file selected.', 'error')
+            return redirect(url_for('lan.panel'))
+
+        filename = secure_filename(f.filename)
+        save_path = os.path.join(folder, filename)
+        key = ACTIVE_SESSIONS.get('enc_key')
+        with phase('disk'):
+            replaced = os.path.getsize(save_path) if os.path.exists(save_path) else 0
+            if key:
+                encrypt_stream(f.stream, save_path, key)
+            else:
+                f.save(save_path)
+            # can't exceed the reservation: the body is read no further than Content-Length
+            used = os.path.getsize(save_path) - replaced
+    finally:
+        settle_storage(otp, reserved, used)
     flash(f"Uploaded: {filename}", "success")
     return redirect(url_for('lan.panel'))
 
@@ -200,7 +268,7 @@ def list_files():
     folder = ACTIVE_SESSIONS.get('folder')
     if not folder or not os.path.exists(folder):
         return jsonify([])
-    return jsonify(sorted(os.listdir(folder)))
+    return jsonify(stored_files(folder))
 
 
 @lan_bp.route('/download/<path:filename>')
@@ -210,7 +278,19 @@ def download_file(filename):
     if not folder or not os.path.exists(os.path.join(folder, filename)):
         flash("File not found or session ended.", "error")
         return redirect(url_for('lan.panel'))
-    return send_from_directory(folder, filename, as_attachment=True)
+    path = safe_join(folder, filename)
+    if path is None:
+        flash("File not found or session ended.", "error")
+        return redirect(url_for('lan.panel'))
+    key = ACTIVE_SESSIONS.get('enc_key')
+    try:
+        if key:
+            return send_encrypted_file(path, key, os.path.basename(filename))
+        return send_cached_file(path, os.path.basename(filename))
+    except (FileNotFoundError, IsADirectoryError):
+        # removed since the check above, or not a file
+        flash("File not found or session ended.", "error")
+        return redirect(url_for('lan.panel'))
 
 
 @lan_bp.route('/end', methods=['GET'])
@@ -232,6 +312,7 @@ def end_session():
     folder = ACTIVE_SESSIONS.get('folder')
     if folder:
         clear_folder(folder)
+        CACHE.discard(folder)
 
     ACTIVE_SESSIONS.clear()
     flash("Session ended and shared files removed.", "info")
@@ -1,12 +1,34 @@
 import logging
 import os
+import json
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; fields passed through log_event() become top-level keys."""
+
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def log_event(logger, event, level=logging.INFO, **fields):
+    """Log a structured event, e.g. log_event(app.logger, 'slow_request', path='/x', total_ms=1200)"""
+    logger.log(level, event, extra={'fields': dict(fields, event=event)})
+
 
 def setup_logging(app):
     log_folder = os.path.join(app.root_path, 'logs')
     os.makedirs(log_folder, exist_ok=True)
     file_handler = logging.FileHandler(os.path.join(log_folder, 'app.log'))
     file_handler.setLevel(logging.INFO)
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    file_handler.setFormatter(formatter)
+    file_handler.setFormatter(JsonFormatter())
     app.logger.addHandler(file_handler)
     app.logger.setLevel(logging.INFO)
@@ -1,4 +1,5 @@
 from app import db
+from flask import current_app
 from flask_login import UserMixin
 
 class User(db.Model, UserMixin):
@@ -6,3 +7,7 @@ class User(db.Model, UserMixin):
     username = db.Column(db.String(150), nullable=False)
     email = db.Column(db.String(150), unique=True, nullable=False)
     password = db.Column(db.String(200), nullable=False)
+
+    @property
+    def is_admin(self):
+        return self.email in current_app.config.get('ADMIN_EMAILS', ())
@@ -1,20 +1,36 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, current_app, send_from_directory
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, current_app
 from flask_login import login_required, current_user
 from flask_socketio import emit, join_room, leave_room
-import redis, os, json, time, secrets, shutil
+import redis, os, json, time, secrets, shutil, tarfile, hashlib
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 from app import socketio
+from app.encryption import generate_key, encrypt_stream, encrypted_size, send_encrypted_file
+from app import quota
+from app.read_cache import CACHE, send_cached_file
+from app.profiling import TracedRedis, PhaseReader, phase
+from app.utils import atomic_write
 
 bp = Blueprint('online_transfer', __name__, url_prefix='/online')
 
 # ---------- Redis Setup ----------
 def get_redis():
     url = current_app.config.get('REDIS_URL', 'redis://localhost:6379/0')
-    return redis.Redis.from_url(url)
+    return TracedRedis.from_url(url)
 
 def session_key(token): return f"session:{token}"
 def participants_key(token): return f"{session_key(token)}:participants"
 def files_key(token): return f"{session_key(token)}:files"
+def events_key(token): return f"{session_key(token)}:events"
+
+# room events kept per session for replay after a reconnect
+EVENT_HISTORY = 500
+# a client further behind than this gets a snapshot instead of a replay
+REPLAY_LIMIT = 200
+# id a page gets when the stream is still empty: replay from the beginning
+STREAM_START = '0-0'
+# folder uploads reserve quota in steps of at least this much
+FOLDER_RESERVE_STEP = 64 * 1024 ** 2
 
 def make_token():
     r = get_redis()
@@ -29,6 +45,77 @@ def session_folder(token):
     os.makedirs(folder, exist_ok=True)
     return folder
 
+def session_enc_key(sess):
+    """Return the at-rest key for a session hash, or None if it's stored in plaintext"""
+    key = sess.get(b'enc_key')
+    return bytes.fromhex(key.decode()) if key else None
+
+def safe_component(part):
+    """
+    secure_filename() for one path component. A name with nothing ASCII-safe
+    left in it ('文件', '文件.txt') becomes a short hash of itself instead
+    ('3f2a9c1b7e4d', '5b1e0f6a2c9d.txt'), so it still gets a stable name.
+    """
+    stem, ext = os.path.splitext(part)
+    if secure_filename(stem or part):
+        return secure_filename(part)
+    digest = hashlib.sha1(part.encode('utf-8', 'surrogateescape')).hexdigest()[:12]
+    ext = secure_filename(ext)
+    return f"{digest}.{ext}" if ext else digest
+
+def safe_relpath(name):
+    """
+    safe_component() applied to every component of a relative path, e.g.
+    'My Project/src/main.py' -> 'My_Project/src/main.py'. Returns None for
+    absolute paths and '..' components.
+    """
+    parts = [p for p in name.replace('\\', '/').split('/') if p not in ('', '.')]
+    if not parts or name.startswith(('/', '\\')) or '..' in parts:
+        return None
+    return '/'.join(safe_component(p) for p in parts)
+
+def save_stream(src, path):
+    """Copy `src` to `path` through a temporary file so a cut-off upload never leaves half a file"""
+    with atomic_write(path) as out:
+        shutil.copyfileobj(src, out, 1024 * 1024)
+
+def discard_ended_upload(token):
+    """Remove what an upload wrote after its session was ended and its folder deleted"""
+    folder = session_folder(token)
+    shutil.rmtree(folder, ignore_errors=True)
+    CACHE.discard(folder)
+
+def register_files(r, token, names):
+    """Append new names to the session's file index in one round trip"""
+    pipe = r.pipeline(transaction=False)
+    for i in range(0, len(names), 1000):
+        pipe.rpush(files_key(token), *names[i:i + 1000])
+    pipe.execute()
+
+def emit_session_event(r, token, event, payload):
+    """Append an event to the session's stream, then broadcast it with its stream id"""
+    pipe = r.pipeline()
+    pipe.xadd(events_key(token), {'event': event, 'data': json.dumps(payload)},
+              maxlen=EVENT_HISTORY, approximate=True)
+    pipe.pttl(session_key(token))
+    event_id, ttl = pipe.execute()
+    if ttl > 0:
+        r.pexpire(events_key(token), ttl)
+    socketio.emit(event, dict(payload, _id=event_id.decode()), room=token)
+
+def last_event_id(r, token):
+    latest = r.xrevrange(events_key(token), count=1)
+    return latest[0][0].decode() if latest else STREAM_START
+
+def session_snapshot(r, token):
+    sess = r.hgetall(session_key(token))
+    return {
+        'participants': [p.decode() for p in r.smembers(participants_key(token))],
+        'files': [f.decode() for f in r.lrange(files_key(token), 0, -1)],
+        'auto_expire': sess.get(b'auto_expire', b'').decode(),
+        '_id': last_event_id(r, token),
+    }
+
 
 # ---------- UI routes ----------
 
@@ -56,6 +143,7 @@ def create_session():
         sess_name = (request.form.get('session_name') or current_user.username).strip()
         password = (request.form.get('password') or '').strip()
         auto_expire = request.form.get('auto_expire')
+        encrypt = bool(request.form.get('encrypt')) or current_app.config.get('AT_REST_ENCRYPTION', False)
 
         try:
             auto_expire = int(auto_expire) * 60 if auto_expire else 0
@@ -72,6 +160,8 @@ def create_session():
             'created_at': str(int(time.time())),
             'closed': '0'
         }
+        if encrypt:
+            data['enc_key'] = generate_key().hex()
 
         r.hset(session_key(token), mapping=data)
         r.sadd(participants_key(token), current_user.username)
@@ -80,6 +170,7 @@ def create_session():
             r.expire(session_key(token), auto_expire)
             r.expire(participants_key(token), auto_expire)
             r.expire(files_key(token), auto_expire)
+            r.expire(events_key(token), auto_expire)
             r.hset(session_key(token), 'auto_expire', str(auto_expire))
 
         flash(f"Session created successfully. Share this token with receivers: {token}", "success")
@@ -113,9 +204,9 @@ def join_session():
 
         r.sadd(participants_key(token), current_user.username)
 
-        socketio.emit('participants_update', {
+        emit_session_event(r, token, 'participants_update', {
             'participants': [p.decode() for p in r.smembers(participants_key(token))]
-        }, room=token)
+        })
 
         flash(f"Joined session owned by {sess.get(b'owner_name').decode()}", "success")
         return redirect(url_for('online_transfer.session_panel', token=token))
@@ -143,6 +234,8 @@ def session_panel(token):
     owner_name = sess.get(b'owner_name').decode()
     is_owner = (sess.get(b'owner_id').decode() == str(current_user.id))
     auto_expire = sess.get(b'auto_expire').decode() if sess.get(b'auto_expire') else ''
+    encrypted = bool(sess.get(b'enc_key'))
+    storage = quota.usage(r, token, current_user.id)
 
     return render_template('online_dashboard.html',
                            token=token,
@@ -150,7 +243,10 @@ def session_panel(token):
                            owner_name=owner_name,
                            participants=participants,
                            is_owner=is_owner,
-                           auto_expire=auto_expire)
+                           auto_expire=auto_expire,
+                           encrypted=encrypted,
+                           storage=storage,
+                           last_event_id=last_event_id(r, token))
 
 
 # ---------- File APIs ----------
@@ -167,23 +263,152 @@ def upload_file(token):
     if current_user.username not in participants:
         return jsonify({'status': 'not_member'}), 403
 
-    if 'file' not in request.files:
-        return jsonify({'status': 'no_file'}), 400
+    # check quota before touching request.files, which would read the whole body
+    key = session_enc_key(sess)
+    reserved = quota.upload_reservation(encrypted=bool(key))
+    if reserved is None:
+        return jsonify({'status': 'length_required'}), 411
+    try:
+        quota.reserve(r, token, current_user.id, reserved)
+    except quota.QuotaExceeded as e:
+        return jsonify({'status': 'quota_exceeded', 'scope': e.scope, 'remaining': e.remaining}), 413
 
-    f = request.files['file']
-    if not f or f.filename == '':
-        return jsonify({'status': 'no_file'}), 400
+    used = 0
+    try:
+        if 'file' not in request.files:
+            return jsonify({'status': 'no_file'}), 400
 
-    filename = secure_filename(f.filename)
-    folder = session_folder(token)
-    f.save(os.path.join(folder, filename))
+        f = request.files['file']
+        if not f or f.filename == '':
+            return jsonify({'status': 'no_file'}), 400
+
+        filename = secure_filename(f.filename)
+        folder = session_folder(token)
+        path = os.path.join(folder, filename)
+        with phase('disk'):
+            replaced = os.path.getsize(path) if os.path.exists(path) else 0
+            try:
+                if key:
+                    encrypt_stream(f.stream, path, key)
+                else:
+                    f.save(path)
+                # can't exceed the reservation: the body is read no further than Content-Length
+                used = os.path.getsize(path) - replaced
+            except FileNotFoundError:
+                # the folder was removed while writing: the session has ended
+                return jsonify({'status': 'not_available'}), 404
+    finally:
+        live = quota.settle(r, token, current_user.id, reserved, used)
+    if not live:
+        discard_ended_upload(token)
+        return jsonify({'status': 'not_available'}), 404
     r.rpush(files_key(token), filename)
 
-    socketio.emit('file_added', {'filename': filename, 'uploader': current_user.username}, room=token)
-    return jsonify({'status': 'ok', 'filename': filename})
+    emit_session_event(r, token, 'file_added', {'filename': filename, 'uploader': current_user.username})
+    return jsonify({'status': 'ok', 'filename': filename, 'storage': quota.usage(r, token, current_user.id)})
+
+
+@bp.route('/upload_folder/<token>', methods=['POST'])
+@login_required
+def upload_folder(token):
+    """
+    Upload a whole folder as one tar stream (optionally gzip/bz2/xz
+    compressed). Entries are extracted as they arrive, so neither the archive
+    nor any file is held in memory, and every file is registered and
+    announced in one go at the end. Links and entries whose name clashes with
+    an earlier one once sanitised are skipped and listed in the response.
+    """
+    r = get_redis()
+    sess = r.hgetall(session_key(token))
+    if not sess or sess.get(b'closed') == b'1':
+        return jsonify({'status': 'not_available'}), 404
+
+    participants = [p.decode() for p in r.smembers(participants_key(token))]
+    if current_user.username not in participants:
+        return jsonify({'status': 'not_member'}), 403
+
+    folder = session_folder(token)
+    key = session_enc_key(sess)
+    max_files = current_app.config['FOLDER_UPLOAD_MAX_FILES']
+    saved, skipped, error = [], [], None
+    sources = {}    # stored name -> entry name it was saved from
+    reserved = used = 0
+    try:
+        # body reads count as 'recv', so 'disk' below is only the writing
+        with tarfile.open(fileobj=PhaseReader(request.stream, 'recv'), mode='r|*') as tar:
+            while True:
+                member = tar.next()
+                if member is None:
+                    break
+                tar.members.clear()     # stream mode would keep every header otherwise
+                if member.isdir():
+                    continue
+                if not member.isreg():
+                    # links, devices, ...
+                    skipped.append({'name': member.name, 'reason': 'not_a_file'})
+                    continue
+                name = safe_relpath(member.name)
+                path = safe_join(folder, name) if name else None
+                if path is None:
+                    error = {'status': 'bad_entry', 'name': member.name}, 400
+                    break
+                if sources.setdefault(name, member.name) != member.name:
+                    # e.g. 'a b' and 'a_b' both become 'a_b': keep the first
+                    skipped.append({'name': member.name, 'reason': 'name_clash', 'stored_as': name})
+                    continue
+                if len(saved) >= max_files:
+                    error = {'status': 'too_many_files', 'limit': max_files}, 413
+                    break
+
+                # sizes come from the entry header, so quota is checked before any bytes are written
+                replaced = os.path.getsize(path) if os.path.isfile(path) else 0
+                need = used + (encrypted_size(member.size) if key else member.size) - replaced - reserved
+                if need > 0:
+                    try:
+                        quota.reserve(r, token, current_user.id, max(need, FOLDER_RESERVE_STEP))
+                        reserved += max(need, FOLDER_RESERVE_STEP)
+                    except quota.QuotaExceeded:
+                        quota.reserve(r, token, current_user.id, need)
+                        reserved += need
+
+                with phase('disk'):
+                    try:
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        if key:
+                            encrypt_stream(tar.extractfile(member), path, key)
+                        else:
+                            save_stream(tar.extractfile(member), path)
+                    except (IsADirectoryError, NotADirectoryError, FileExistsError):
+                        error = {'status': 'bad_entry', 'name': member.name}, 409
+                        break
+                    used += os.path.getsize(path) - replaced
+                saved.append(name)
+    except quota.QuotaExceeded as e:
+        error = {'status': 'quota_exceeded', 'scope': e.scope, 'remaining': e.remaining}, 413
+    except (tarfile.TarError, EOFError):
+        error = {'status': 'bad_archive'}, 400
+    except FileNotFoundError:
+        # the folder was removed while writing: the session has ended
+        error = {'status': 'not_available'}, 404
+    finally:
+        live = quota.settle(r, token, current_user.id, reserved, used)
+    if not live:
+        discard_ended_upload(token)
+        return jsonify({'status': 'not_available'}), 404
 
+    # whatever made it to disk is registered, even if the upload stopped early
+    known = {f.decode() for f in r.lrange(files_key(token), 0, -1)}
+    added = [name for name in dict.fromkeys(saved) if name not in known]
+    if added:
+        register_files(r, token, added)
+        emit_session_event(r, token, 'file_added', {'filenames': added, 'uploader': current_user.username})
 
-@bp.route('/download/<token>/<filename>')
+    body, code = error or ({'status': 'ok'}, 200)
+    return jsonify(dict(body, saved=len(saved), skipped=skipped,
+                        storage=quota.usage(r, token, current_user.id))), code
+
+
+@bp.route('/download/<token>/<path:filename>')
 @login_required
 def download_file(token, filename):
     r = get_redis()
@@ -198,11 +423,21 @@ def download_file(token, filename):
         return redirect(url_for('online_transfer.select_mode'))
 
     folder = session_folder(token)
-    safe = secure_filename(filename)
-    if safe not in [f.decode() for f in r.lrange(files_key(token), 0, -1)]:
+    safe = safe_relpath(filename)
+    if not safe or safe not in [f.decode() for f in r.lrange(files_key(token), 0, -1)]:
+        flash("File not found.", "danger")
+        return redirect(url_for('online_transfer.session_panel', token=token))
+
+    path = safe_join(folder, safe)
+    key = session_enc_key(sess)
+    try:
+        if key:
+            return send_encrypted_file(path, key, os.path.basename(safe))
+        return send_cached_file(path, os.path.basename(safe))
+    except (FileNotFoundError, IsADirectoryError):
+        # indexed but gone from disk, e.g. the session folder was cleaned up
         flash("File not found.", "danger")
         return redirect(url_for('online_transfer.session_panel', token=token))
-    return send_from_directory(folder, safe, as_attachment=True)
 
 
 @bp.route('/end/<token>', methods=['POST'])
@@ -224,10 +459,13 @@ def end_session(token):
             shutil.rmtree(folder)
     except Exception:
         pass
+    CACHE.discard(folder)
 
     r.delete(session_key(token))
     r.delete(participants_key(token))
     r.delete(files_key(token))
+    r.delete(events_key(token))
+    quota.clear_session(r, token)
 
     socketio.emit('session_ended', {}, room=token)
     return jsonify({'status': 'ended'})
@@ -254,20 +492,56 @@ def set_auto_expire(token):
     r.expire(session_key(token), seconds)
     r.expire(participants_key(token), seconds)
     r.expire(files_key(token), seconds)
+    r.expire(events_key(token), seconds)
+    r.expire(quota.session_usage_key(token), seconds)
     r.hset(session_key(token), 'auto_expire', str(seconds))
 
-    socketio.emit('auto_expire_set', {'minutes': minutes}, room=token)
+    emit_session_event(r, token, 'auto_expire_set', {'minutes': minutes})
     return jsonify({'status': 'ok', 'minutes': minutes})
 
 
 # ---------- SocketIO events ----------
+def replay_events(r, token, last_id):
+    """
+    Send this client the room events after `last_id`. If that id has been
+    trimmed from the stream (or the client is too far behind) send a
+    snapshot of the session instead.
+    """
+    key = events_key(token)
+    try:
+        # anything trimmed since STREAM_START means > REPLAY_LIMIT were missed
+        known = last_id == STREAM_START or r.xrange(key, min=last_id, max=last_id, count=1)
+        missed = r.xrange(key, min='(' + last_id, count=REPLAY_LIMIT + 1) if known else []
+    except redis.ResponseError:   # malformed id
+        known, missed = [], []
+
+    if not known or len(missed) > REPLAY_LIMIT:
+        emit('session_snapshot', session_snapshot(r, token))
+        return
+    for event_id, fields in missed:
+        emit(fields[b'event'].decode(), dict(json.loads(fields[b'data']), _id=event_id.decode()))
+
+
 @socketio.on('join_room')
 def handle_join(data):
     token = data.get('token')
-    join_room(token)
     r = get_redis()
+    sess = r.hgetall(session_key(token))
+    if not sess or sess.get(b'closed') == b'1':
+        emit('session_ended', {})
+        return
+
     participants = [p.decode() for p in r.smembers(participants_key(token))]
-    emit('participants_update', {'participants': participants}, room=token)
+    if not current_user.is_authenticated or current_user.username not in participants:
+        return
+
+    join_room(token)
+    last_id = data.get('last_id')
+    if last_id:
+        replay_events(r, token, last_id)
+    # every (re)connect sends this; kept out of the stream so reconnect storms
+    # don't crowd real events out of the replay window
+    socketio.emit('participants_update', {'participants': participants}, room=token)
 
 
 @socketio.on('leave_room')
@@ -0,0 +1,469 @@
+# app/profiling.py
+"""
+Runtime profiling for stalled transfers (admin only, off by default).
+
+When switched on (POST /admin/profiling/start, shared with every worker via
+Redis) each process runs:
+
+- a sampling profiler: a real OS thread that snapshots the running stack
+  PROFILING_SAMPLE_HZ times a second and aggregates them in collapsed-stack
+  form, which flamegraph.pl / speedscope read directly
+  (GET /admin/profiling/flamegraph);
+- slow-request tracing: every request records time spent in auth, Redis,
+  receiving the body, disk and sending the response; requests slower than PROFILING_SLOW_MS are
+  logged with that breakdown and the request's counters (e.g. read cache
+  hits and misses, see app/read_cache.py);
+- an eventlet hub watchdog: a green ticker that should run every few ms and a
+  real thread that notices when it doesn't. When the hub is blocked longer
+  than HUB_BLOCK_MS the stack of whatever is hogging it is logged.
+
+Every PUBLISH_INTERVAL seconds each worker stores its status and stacks in
+Redis (`profiling:worker:<index>`), so whichever worker answers the admin
+routes reports the whole pool, not just itself.
+
+Everything goes to the structured log set up in app/logger.py.
+"""
+from flask import Blueprint, current_app, g, jsonify, request, abort, session, has_app_context, Response
+from flask_login import current_user, login_required
+from contextlib import contextmanager
+from collections import Counter, defaultdict, deque
+from functools import wraps
+from werkzeug.wsgi import ClosingIterator
+import os, sys, time, json, logging, importlib, traceback
+import redis
+
+from app import socketio
+from app.logger import log_event
+
+profiling_bp = Blueprint('profiling', __name__, url_prefix='/admin/profiling')
+
+ENABLED_KEY = 'profiling:enabled'
+RESET_KEY = 'profiling:reset'
+SYNC_INTERVAL = 2.0
+PUBLISH_INTERVAL = 5.0
+PUBLISH_TTL = 3600         # published profiles outlive a stop so they can still be read
+PUBLISH_STACKS = 5000      # most common stacks each worker publishes
+MAX_STACKS = 20000
+MAX_DEPTH = 128
+
+# real thread idents of the profiler's own threads, never sampled
+PROFILER_THREADS = set()
+
+STATE = {
+    'enabled': False,
+    'synced_at': 0.0,
+    'sampler': None,
+    'watchdog': None,
+    'slow_requests': 0,
+    'redis': None,
+}
+
+
+def _original(name):
+    """The unpatched stdlib module, so profiler threads are real OS threads even under eventlet"""
+    try:
+        from eventlet import patcher
+        return patcher.original(name)
+    except ImportError:
+        return importlib.import_module(name)
+
+
+def _eventlet_active():
+    try:
+        from eventlet import patcher
+        return patcher.is_monkey_patched('thread')
+    except ImportError:
+        return False
+
+
+def _collapse(frame):
+    """Render a frame's stack root-first as `a (file:line);b (file:line);...`"""
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+# ---------- sampling profiler ----------
+class Sampler:
+    def __init__(self, hz):
+        threading = _original('threading')
+        self.interval = 1.0 / hz
+        self.stacks = Counter()
+        self.samples = 0
+        self.dropped = 0
+        self.reset_seen = None     # last RESET_KEY value acted on
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='shieldnet-sampler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def _run(self):
+        PROFILER_THREADS.add(_original('threading').get_ident())
+        while not self.stopped.wait(self.interval):
+            frames = sys._current_frames()
+            with self.lock:
+                for ident, frame in frames.items():
+                    if ident in PROFILER_THREADS:
+                        continue
+                    stack = _collapse(frame)
+                    if stack in self.stacks or len(self.stacks) < MAX_STACKS:
+                        self.stacks[stack] += 1
+                    else:
+                        self.dropped += 1
+                self.samples += 1
+
+    def collapsed(self, reset=False, limit=None):
+        with self.lock:
+            lines = [f"{stack} {count}" for stack, count in self.stacks.most_common(limit)]
+            if reset:
+                self.stacks.clear()
+                self.samples = self.dropped = 0
+        return '\n'.join(lines) + '\n'
+
+
+# ---------- eventlet hub watchdog ----------
+class HubWatchdog:
+    """
+    A green ticker stamps `last_tick` every TICK seconds; a real thread checks
+    the stamp. The real thread never logs (logging locks are green under
+    eventlet) - it queues reports and the ticker writes them once the hub
+    is free again.
+    """
+    TICK = 0.05
+
+    def __init__(self, threshold_ms, logger):
+        threading = _original('threading')
+        self.threshold = threshold_ms / 1000.0
+        self.logger = logger
+        self.blocks = 0
+        self.last_tick = time.monotonic()
+        self.reports = deque(maxlen=100)
+        self.running = True
+        self.hub_ident = threading.get_ident()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._watch, name='shieldnet-hub-watchdog', daemon=True)
+
+    def start(self):
+        socketio.start_background_task(self._tick)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.stopped.set()
+
+    def _tick(self):
+        while self.running:
+            self.last_tick = time.monotonic()
+            while self.reports:
+                log_event(self.logger, 'hub_blocked', level=logging.WARNING, **self.reports.popleft())
+            socketio.sleep(self.TICK)
+
+    def _watch(self):
+        PROFILER_THREADS.add(_original('threading').get_ident())
+        blocked_since = None
+        while not self.stopped.wait(self.TICK):
+            lag = time.monotonic() - self.last_tick
+            if lag > self.threshold and blocked_since is None:
+                blocked_since = self.last_tick
+                frame = sys._current_frames().get(self.hub_ident)
+                stack = ''.join(traceback.format_stack(frame)) if frame else ''
+                self.blocks += 1
+                self.reports.append({'blocked_ms': round(lag * 1000), 'pid': os.getpid(), 'stack': stack})
+            elif lag <= self.threshold and blocked_since is not None:
+                self.reports.append({'blocked_ms': round((self.last_tick - blocked_since) * 1000),
+                                     'pid': os.getpid(), 'recovered': True})
+                blocked_since = None
+
+
+# ---------- on/off ----------
+def _start(app):
+    sampler = Sampler(app.config['PROFILING_SAMPLE_HZ'])
+    sampler.start()
+    STATE['sampler'] = sampler
+    if _eventlet_active():
+        STATE['watchdog'] = HubWatchdog(app.config['HUB_BLOCK_MS'], app.logger)
+        STATE['watchdog'].start()
+    STATE['enabled'] = True
+    socketio.start_background_task(_publish_loop, app, sampler)
+    log_event(app.logger, 'profiling_started', pid=os.getpid())
+
+
+def _stop(app):
+    for key in ('sampler', 'watchdog'):
+        if STATE[key]:
+            STATE[key].stop()
+    STATE['watchdog'] = None
+    STATE['enabled'] = False
+    log_event(app.logger, 'profiling_stopped', pid=os.getpid())
+
+
+def _control_redis():
+    if STATE['redis'] is None:
+        STATE['redis'] = redis.Redis.from_url(current_app.config['REDIS_URL'])
+    return STATE['redis']
+
+
+def sync(force=False):
+    """Follow the shared on/off switch; checked at most every SYNC_INTERVAL seconds"""
+    now = time.monotonic()
+    if not force and now - STATE['synced_at'] < SYNC_INTERVAL:
+        return
+    STATE['synced_at'] = now
+    try:
+        wanted = _control_redis().get(ENABLED_KEY) == b'1'
+    except redis.RedisError:
+        return
+    if wanted and not STATE['enabled']:
+        _start(current_app._get_current_object())
+    elif not wanted and STATE['enabled']:
+        _stop(current_app._get_current_object())
+
+
+# ---------- pool-wide view ----------
+def profile_key(index): return f"profiling:worker:{index}"
+
+
+def _publish(sampler):
+    """Store this worker's status and most common stacks for the admin routes to merge"""
+    from app.workers import WORKER_STATE
+    r = _control_redis()
+    reset = int(r.get(RESET_KEY) or 0)
+    if sampler.reset_seen is not None and reset != sampler.reset_seen:
+        sampler.collapsed(reset=True)
+    sampler.reset_seen = reset
+    payload = {'status': status(), 'stacks': sampler.collapsed(limit=PUBLISH_STACKS)}
+    r.set(profile_key(WORKER_STATE['index']), json.dumps(payload), ex=PUBLISH_TTL)
+
+
+def _publish_loop(app, sampler):
+    """Publish every PUBLISH_INTERVAL while `sampler` runs, and once more after it stops"""
+    while True:
+        socketio.sleep(PUBLISH_INTERVAL)
+        with app.app_context():
+            sync()     # idle workers follow the on/off switch here, not only on requests
+            if STATE['sampler'] is not sampler:
+                return
+            try:
+                _publish(sampler)
+            except redis.RedisError:
+                pass
+            if not STATE['enabled']:
+                return
+
+
+def published():
+    """{worker index: {'status', 'stacks'}} for every worker that has published, this one freshly"""
+    if STATE['sampler']:
+        try:
+            _publish(STATE['sampler'])
+        except redis.RedisError:
+            pass
+    profiles = {}
+    try:
+        r = _control_redis()
+        for key in r.scan_iter(match=profile_key('*')):
+            raw = r.get(key)
+            if raw:
+                profiles[int(key.rsplit(b':', 1)[1])] = json.loads(raw)
+    except redis.RedisError:
+        pass
+    return dict(sorted(profiles.items()))
+
+
+# ---------- request tracing ----------
+@contextmanager
+def phase(name):
+    """
+    Attribute the time spent in the block to `name` for the current request.
+    Phases nest: time spent in an inner phase only counts toward the inner one.
+    """
+    perf = g.get('perf') if has_app_context() else None
+    if perf is None:
+        yield
+        return
+    outer, perf['inner'] = perf['inner'], 0.0
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        perf['phases'][name] += elapsed - perf['inner']
+        perf['inner'] = outer + elapsed
+
+
+class PhaseReader:
+    """File-like wrapper whose reads count toward `name`, e.g. the request body as 'recv'"""
+
+    def __init__(self, raw, name):
+        self.raw = raw
+        self.name = name
+
+    def read(self, n=-1):
+        with phase(self.name):
+            return self.raw.read(n)
+
+
+def request_counters():
+    """
+    The current request's event counters (a Counter that is logged with the
+    request), or None when it isn't traced. Safe to keep and bump while the
+    response is still streaming.
+    """
+    perf = g.get('perf') if has_app_context() else None
+    return perf['counters'] if perf is not None else None
+
+
+class TracedRedis(redis.Redis):
+    """Redis client whose commands count toward the request's `redis` phase"""
+
+    def execute_command(self, *args, **options):
+        with phase('redis'):
+            return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return TracedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class TracedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        with phase('redis'):
+            return super().execute(raise_on_error)
+
+
+@profiling_bp.before_app_request
+def start_trace():
+    sync()
+    if STATE['enabled']:
+        g.perf = {'start': time.perf_counter(), 'phases': defaultdict(float), 'counters': Counter(),
+                  'inner': 0.0}
+
+
+@profiling_bp.after_app_request
+def finish_trace(response):
+    perf = g.pop('perf', None)
+    if perf is None:
+        return response
+    perf['send_start'] = time.perf_counter()
+    logger = current_app.logger
+    slow = current_app.config['PROFILING_SLOW_MS'] / 1000.0
+    info = {'method': request.method, 'path': request.path, 'status': response.status_code,
+            'user': session.get('_user_id')}
+
+    def report():
+        end = time.perf_counter()
+        perf['phases']['send'] += end - perf['send_start']
+        total = end - perf['start']
+        if total < slow:
+            return
+        STATE['slow_requests'] += 1
+        phases = {f"{k}_ms": round(v * 1000, 1) for k, v in perf['phases'].items()}
+        other = total - sum(perf['phases'].values())
+        log_event(logger, 'slow_request', level=logging.WARNING, total_ms=round(total * 1000, 1),
+                  other_ms=round(max(other, 0) * 1000, 1), pid=os.getpid(), **info, **phases, **perf['counters'])
+
+    if response.direct_passthrough:
+        # passthrough bodies (send_file) go to the server as-is and never call
+        # the response's close callbacks, so hook the body itself
+        response.response = ClosingIterator(response.response, report)
+    else:
+        response.call_on_close(report)
+    return response
+
+
+# ---------- admin routes ----------
+def admin_required(view):
+    @wraps(view)
+    @login_required
+    def wrapped(*args, **kwargs):
+        if not current_user.is_admin:
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapped
+
+
+def status():
+    from app.workers import WORKER_STATE
+    sampler, watchdog = STATE['sampler'], STATE['watchdog']
+    return {
+        'enabled': STATE['enabled'],
+        'worker': WORKER_STATE['index'],
+        'pid': os.getpid(),
+        'samples': sampler.samples if sampler else 0,
+        'distinct_stacks': len(sampler.stacks) if sampler else 0,
+        'hub_blocks': watchdog.blocks if watchdog else 0,
+        'slow_requests': STATE['slow_requests'],
+        'slow_ms': current_app.config['PROFILING_SLOW_MS'],
+        'sample_hz': current_app.config['PROFILING_SAMPLE_HZ'],
+        'hub_block_ms': current_app.config['HUB_BLOCK_MS'],
+    }
+
+
+@profiling_bp.route('', methods=['GET'])
+@admin_required
+def profiling_status():
+    """This worker's status plus the last one published by every worker"""
+    return jsonify(dict(status(), workers=[p['status'] for p in published().values()]))
+
+
+@profiling_bp.route('/start', methods=['POST'])
+@admin_required
+def profiling_start():
+    _control_redis().set(ENABLED_KEY, '1')
+    sync(force=True)
+    return jsonify(status())
+
+
+@profiling_bp.route('/stop', methods=['POST'])
+@admin_required
+def profiling_stop():
+    _control_redis().delete(ENABLED_KEY)
+    sync(force=True)
+    return jsonify(status())
+
+
+@profiling_bp.route('/flamegraph', methods=['GET'])
+@admin_required
+def flamegraph():
+    """
+    Collapsed stacks merged across the pool (other workers' are up to
+    PUBLISH_INTERVAL old). ?worker=<index> limits it to one worker,
+    ?split=1 puts each worker under its own root frame and ?reset=1 clears
+    the stacks on every worker after reading.
+    """
+    profiles = published()
+    if request.args.get('worker') is not None:
+        index = request.args.get('worker', type=int)
+        profiles = {index: profiles[index]} if index in profiles else {}
+    if not profiles:
+        return jsonify({'status': 'no_profile'}), 404
+
+    split = request.args.get('split') == '1'
+    merged = Counter()
+    for index, profile in profiles.items():
+        root = f"worker {index} (pid {profile['status']['pid']});" if split else ''
+        for line in profile['stacks'].splitlines():
+            stack, _, count = line.rpartition(' ')
+            if stack:
+                merged[root + stack] += int(count)
+
+    if request.args.get('reset') == '1':
+        # other workers clear theirs when they next publish
+        reset = _control_redis().incr(RESET_KEY)
+        if STATE['sampler']:
+            STATE['sampler'].collapsed(reset=True)
+            STATE['sampler'].reset_seen = reset
+
+    body = ''.join(f"{stack} {count}\n" for stack, count in merged.most_common())
+    name = f"worker-{next(iter(profiles))}" if len(profiles) == 1 else 'pool'
+    resp = Response(body, mimetype='text/plain')
+    resp.headers['X-Profile-Workers'] = ','.join(str(i) for i in profiles)
+    resp.headers['Content-Disposition'] = f'attachment; filename=profile-{name}.folded'
+    return resp
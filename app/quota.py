@@ -0,0 +1,152 @@
+# app/quota.py
+"""
+Per-session and per-user storage quotas, tracked in Redis.
+
+Each session has a byte counter and each user a hash of token -> bytes. An
+upload reserves its declared size up front with a single Lua script, so two
+concurrent uploads can't both squeeze past the limit, and settles to the real
+size on disk (or releases everything) once the upload finishes. Entries for
+sessions that have expired or ended are pruned from the user hash lazily.
+
+A limit of 0 means unlimited. LAN mode checks its one session against
+SESSION_QUOTA_BYTES in process memory instead, see app/lan_transfer.py.
+"""
+from flask import current_app, request
+
+from app.encryption import encrypted_size
+
+SESSION_PREFIX = 'session:'
+
+RESERVE_LUA = """
+local n = tonumber(ARGV[1])
+local session_limit, user_limit = tonumber(ARGV[2]), tonumber(ARGV[3])
+local token, prefix = ARGV[4], ARGV[5]
+
+local session_used = tonumber(redis.call('GET', KEYS[1]) or '0')
+local user_used = 0
+if KEYS[2] ~= '' then
+  local usage = redis.call('HGETALL', KEYS[2])
+  for i = 1, #usage, 2 do
+    if usage[i] ~= token and redis.call('EXISTS', prefix .. usage[i]) == 0 then
+      redis.call('HDEL', KEYS[2], usage[i])
+    else
+      user_used = user_used + tonumber(usage[i + 1])
+    end
+  end
+end
+
+if session_limit > 0 and session_used + n > session_limit then
+  return {0, 'session', session_limit - session_used}
+end
+if KEYS[2] ~= '' and user_limit > 0 and user_used + n > user_limit then
+  return {0, 'user', user_limit - user_used}
+end
+
+redis.call('INCRBY', KEYS[1], n)
+if KEYS[2] ~= '' then
+  redis.call('HINCRBY', KEYS[2], token, n)
+end
+-- usage expires together with the session
+local ttl = redis.call('PTTL', prefix .. token)
+if ttl > 0 then
+  redis.call('PEXPIRE', KEYS[1], ttl)
+end
+return {1, '', 0}
+"""
+
+
+SETTLE_LUA = """
+local delta, token, prefix = ARGV[1], ARGV[2], ARGV[3]
+-- a session that ended mid-upload has had its usage cleared: don't recreate it
+if redis.call('EXISTS', prefix .. token) == 0 then
+  return 0
+end
+redis.call('INCRBY', KEYS[1], delta)
+if KEYS[2] ~= '' then
+  redis.call('HINCRBY', KEYS[2], token, delta)
+end
+return 1
+"""
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, scope, remaining):
+        super().__init__(f"{scope} quota exceeded")
+        self.scope = scope
+        self.remaining = max(int(remaining), 0)
+
+
+def session_usage_key(token): return f"quota:session:{token}"
+def user_usage_key(user_id): return f"quota:user:{user_id}"
+
+
+def limits():
+    cfg = current_app.config
+    return int(cfg.get('SESSION_QUOTA_BYTES', 0)), int(cfg.get('USER_QUOTA_BYTES', 0))
+
+
+def upload_reservation(encrypted=False):
+    """
+    Bytes to reserve before reading a multipart upload, or None when the body
+    has no Content-Length (e.g. chunked). The stored file can't outgrow the
+    body, since the body is read no further than Content-Length, apart from
+    the record overhead when it's encrypted at rest.
+    """
+    length = request.content_length
+    if length is None:
+        return None
+    return encrypted_size(length) if encrypted else length
+
+
+def reserve(r, token, user_id, nbytes):
+    """Atomically reserve `nbytes` for an upload, or raise QuotaExceeded"""
+    session_limit, user_limit = limits()
+    user_key = user_usage_key(user_id) if user_id is not None else ''
+    ok, scope, remaining = r.register_script(RESERVE_LUA)(
+        keys=[session_usage_key(token), user_key],
+        args=[int(nbytes), session_limit, user_limit, token, SESSION_PREFIX])
+    if not ok:
+        raise QuotaExceeded(scope.decode() if isinstance(scope, bytes) else scope, remaining)
+
+
+def settle(r, token, user_id, reserved, used):
+    """
+    Replace a reservation with the bytes actually stored (0 releases it all).
+    Returns False, changing nothing, when the session has ended meanwhile.
+    """
+    user_key = user_usage_key(user_id) if user_id is not None else ''
+    return bool(r.register_script(SETTLE_LUA)(
+        keys=[session_usage_key(token), user_key],
+        args=[int(used) - int(reserved), token, SESSION_PREFIX]))
+
+
+def clear_session(r, token):
+    """Forget a session's usage when it ends; user hashes drop the token on their next reserve"""
+    r.delete(session_usage_key(token))
+
+
+def usage(r, token, user_id=None):
+    """Used / limit / remaining bytes for display; remaining is None when unlimited"""
+    session_limit, user_limit = limits()
+    session_used = int(r.get(session_usage_key(token)) or 0)
+    user_used = 0
+    if user_id is not None:
+        per_session = r.hgetall(user_usage_key(user_id))
+        pipe = r.pipeline()
+        for t in per_session:
+            pipe.exists(SESSION_PREFIX + t.decode())
+        live = pipe.execute() if per_session else []
+        user_used = sum(int(v) for v, alive in zip(per_session.values(), live) if alive)
+
+    caps = []
+    if session_limit:
+        caps.append(session_limit - session_used)
+    if user_limit and user_id is not None:
+        caps.append(user_limit - user_used)
+    return {
+        'session_used': session_used,
+        'session_limit': session_limit,
+        'user_used': user_used,
+        'user_limit': user_limit,
+        'remaining': max(min(caps), 0) if caps else None,
+    }
@@ -0,0 +1,264 @@
+# app/read_cache.py
+"""
+Shared read cache for session downloads.
+
+A session usually has one sender and many receivers pulling the same file at
+the same moment. Downloads read files through this module in CHUNK_SIZE
+pieces kept in a process-wide LRU bounded by READ_CACHE_BYTES, so the file is
+read from disk once per worker instead of once per receiver. When several
+requests miss on the same chunk together only the first reads it; the others
+wait for that read and share its result. Under eventlet the disk read runs in
+the thread pool so it doesn't stall the hub while they wait.
+
+Chunks are keyed by path, inode, mtime and size, so a replaced file never
+serves stale bytes. Encrypted files are cached as ciphertext and decrypted
+per request, so plaintext never sits in the cache.
+
+Counters are reported per request in the slow_request log (cache_hits,
+cache_misses, cache_waits) and per worker in GET /healthz.
+"""
+from flask import request, Response
+from werkzeug.datastructures import ContentRange
+from werkzeug.http import is_resource_modified
+from collections import OrderedDict
+from datetime import datetime, timezone
+import os, threading, mimetypes
+
+from app.profiling import request_counters
+
+CHUNK_SIZE = 1024 * 1024
+
+# request counter bumped for each outcome of ChunkCache.get
+COUNTERS = {'hit': 'cache_hits', 'miss': 'cache_misses', 'wait': 'cache_waits'}
+
+
+def _pread(fd, length, offset):
+    try:
+        from eventlet import patcher, tpool
+        if patcher.is_monkey_patched('thread'):
+            return tpool.execute(os.pread, fd, length, offset)
+    except ImportError:
+        pass
+    return os.pread(fd, length, offset)
+
+
+class _Pending:
+    """A chunk read in progress that other requests can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.data = None
+        self.error = None
+
+
+class ChunkCache:
+    def __init__(self, budget=0):
+        self.budget = budget
+        self.entries = OrderedDict()   # key -> bytes, least recently used first
+        self.pending = {}              # key -> _Pending
+        self.used = 0
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.waits = self.evictions = 0
+
+    def get(self, key, load):
+        """
+        Return (data, outcome) for `key`, calling load() on a miss. outcome is
+        'hit', 'miss' or 'wait' (another request was already loading it).
+        """
+        while True:
+            with self.lock:
+                data = self.entries.get(key)
+                if data is not None:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return data, 'hit'
+                pending = self.pending.get(key)
+                leader = pending is None
+                if leader:
+                    pending = self.pending[key] = _Pending()
+                    self.misses += 1
+                else:
+                    self.waits += 1
+
+            if not leader:
+                pending.done.wait()
+                if pending.error is not None:
+                    raise pending.error
+                if pending.data is None:
+                    continue    # the reader was killed (GreenletExit, Timeout); try again
+                return pending.data, 'wait'
+
+            try:
+                pending.data = load()
+            except Exception as e:
+                pending.error = e
+                raise
+            finally:
+                # waiters must be released however the read ended
+                try:
+                    with self.lock:
+                        del self.pending[key]
+                        if pending.data is not None:
+                            self._store(key, pending.data)
+                finally:
+                    pending.done.set()
+            return pending.data, 'miss'
+
+    def _store(self, key, data):
+        if len(data) > self.budget:
+            return
+        self.entries[key] = data
+        self.used += len(data)
+        while self.used > self.budget:
+            _, old = self.entries.popitem(last=False)
+            self.used -= len(old)
+            self.evictions += 1
+
+    def discard(self, folder):
+        """Drop every chunk of the files under `folder`, e.g. when a session ends"""
+        prefix = os.path.join(os.path.abspath(folder), '')
+        with self.lock:
+            for key in [k for k in self.entries if k[0].startswith(prefix)]:
+                self.used -= len(self.entries.pop(key))
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'waits': self.waits,
+            'evictions': self.evictions,
+            'chunks': len(self.entries),
+            'bytes': self.used,
+            'budget': self.budget,
+        }
+
+
+CACHE = ChunkCache()
+
+
+class CachedFile:
+    """
+    Read-only binary file whose reads go through CACHE. Open it while handling
+    the request so its hits and misses are counted against that request.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.fh = open(self.path, 'rb')
+        st = os.fstat(self.fh.fileno())
+        self.identity = (self.path, st.st_ino, st.st_mtime_ns, st.st_size)
+        self.size = st.st_size
+        self.pos = 0
+        self.counters = request_counters()
+
+    def fileno(self):
+        return self.fh.fileno()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self.pos, os.SEEK_END: self.size}[whence]
+        self.pos = max(base + offset, 0)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self, n=-1):
+        stop = self.size if n is None or n < 0 else min(self.pos + n, self.size)
+        data = b''.join(self.iter_range(self.pos, stop))
+        self.pos += len(data)
+        return data
+
+    def chunk(self, index):
+        if CACHE.budget <= 0:
+            return _pread(self.fh.fileno(), CHUNK_SIZE, index * CHUNK_SIZE)
+        data, outcome = CACHE.get(self.identity + (index,),
+                                  lambda: _pread(self.fh.fileno(), CHUNK_SIZE, index * CHUNK_SIZE))
+        if self.counters is not None:
+            self.counters[COUNTERS[outcome]] += 1
+        return data
+
+    def iter_range(self, start, stop):
+        """Yield the bytes in [start, stop); whole chunks are passed on without copying"""
+        stop = min(stop, self.size)
+        while start < stop:
+            index, offset = divmod(start, CHUNK_SIZE)
+            data = self.chunk(index)
+            piece = data if offset == 0 and len(data) <= stop - start else data[offset:offset + stop - start]
+            if not piece:
+                return   # file shrank underneath us
+            yield piece
+            start += len(piece)
+
+    def close(self):
+        self.fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def send_range(fh, size, stream, download_name):
+    """
+    Stream a `size` byte body read from CachedFile `fh` as an attachment,
+    honouring conditional and single byte-range requests. stream(start, stop)
+    yields the bytes of [start, stop); `fh` is closed when the response is.
+    """
+    # files are replaced in place on re-upload, so the validators come from
+    # the open file: a resumed download never joins two versions
+    _, ino, mtime_ns, file_size = fh.identity
+    etag = f"{ino:x}-{mtime_ns:x}-{file_size:x}"
+    last_modified = datetime.fromtimestamp(mtime_ns // 10 ** 9, timezone.utc)
+
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        fh.close()
+        resp = Response(status=304)
+        resp.set_etag(etag)
+        return resp
+
+    start, stop, status = 0, size, 200
+
+    rng = request.range
+    if (rng is not None and rng.units == 'bytes' and len(rng.ranges) == 1
+            and _if_range_matches(etag, last_modified)):
+        bounds = rng.range_for_length(size)
+        if bounds is None:
+            fh.close()
+            resp = Response(status=416)
+            resp.headers['Content-Range'] = f'bytes */{size}'
+            return resp
+        start, stop = bounds
+        status = 206
+
+    mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    resp = Response(stream(start, stop), status=status, mimetype=mimetype)
+    resp.call_on_close(fh.close)
+    resp.content_length = stop - start
+    if status == 206:
+        resp.content_range = ContentRange('bytes', start, stop, size)
+    resp.set_etag(etag)
+    resp.last_modified = last_modified
+    resp.headers['Accept-Ranges'] = 'bytes'
+    resp.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    return resp
+
+
+def _if_range_matches(etag, last_modified):
+    """A Range only applies to the version named by If-Range (if any); otherwise send it all"""
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    if if_range.date is not None:
+        return last_modified <= if_range.date
+    return True
+
+
+def send_cached_file(path, download_name):
+    """Send a plain (unencrypted) file as an attachment through the cache"""
+    fh = CachedFile(path)
+    return send_range(fh, fh.size, fh.iter_range, download_name)
+
+
+def init_app(app):
+    CACHE.budget = app.config['READ_CACHE_BYTES']
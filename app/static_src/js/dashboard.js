@@ -0,0 +1,21 @@
+const starContainer = document.getElementById('stars');
+for (let i = 0; i < 80; i++) {
+  const star = document.createElement('div');
+  const size = Math.random() * 2 + 1 + 'px';
+  star.classList.add('star');
+  star.style.width = size;
+  star.style.height = size;
+  star.style.top = Math.random() * 100 + '%';
+  star.style.left = Math.random() * 100 + '%';
+  star.style.animationDelay = Math.random() * 2 + 's';
+  starContainer.appendChild(star);
+}
+
+// Profile Dropdown
+document.querySelector('.profile-icon').addEventListener('click', function() {
+  document.getElementById('profileMenu').classList.toggle('active');
+});
+document.addEventListener('click', function(e) {
+  const menu = document.getElementById('profileMenu');
+  if (!menu.contains(e.target)) menu.classList.remove('active');
+});
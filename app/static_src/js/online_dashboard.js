@@ -0,0 +1,378 @@
+const { token, username, exitUrl } = document.body.dataset;
+const socket = io();
+let selectedFiles = [];
+
+/* Id of the last room event applied to this page; sent on (re)connect so the
+   server replays only what was missed while the socket was down */
+let lastEventId = document.body.dataset.lastEventId;
+
+/* ⭐ FIXED: ROOM JOIN AFTER CONNECT */
+socket.on("connect", () => {
+  socket.emit("join_room", { token: token, user: username, last_id: lastEventId });
+});
+
+/* Stream ids look like "<ms>-<seq>"; compare numerically */
+function compareIds(a, b) {
+  const [am, as] = a.split("-").map(Number);
+  const [bm, bs] = b.split("-").map(Number);
+  return am - bm || as - bs;
+}
+
+/* True the first time an event is seen; live broadcasts and replays can overlap */
+function isNewEvent(data) {
+  if (!data || !data._id) return true;
+  if (lastEventId && compareIds(data._id, lastEventId) <= 0) return false;
+  lastEventId = data._id;
+  return true;
+}
+
+/* Toast */
+function showToast(msg) {
+  const c = document.getElementById('toast-container');
+  const t = document.createElement('div');
+  t.className = 'toast';
+  t.textContent = msg;
+  c.appendChild(t);
+  setTimeout(() => t.classList.add('fade-out'), 2500);
+  setTimeout(() => t.remove(), 3200);
+}
+
+/* Copy button */
+document.getElementById("copy-btn")
+.addEventListener("click", () => {
+  navigator.clipboard.writeText(document.getElementById("token-text").textContent);
+  showToast("Token copied 📋");
+});
+
+/* Drag & drop */
+const drop = document.getElementById("drop-zone");
+const input = document.getElementById("file-input");
+const names = document.getElementById("file-names");
+
+drop.addEventListener("click", () => input.click());
+drop.addEventListener("dragover", e => { e.preventDefault(); drop.classList.add("dragover"); });
+drop.addEventListener("dragleave", () => drop.classList.remove("dragover"));
+drop.addEventListener("drop", e => {
+  e.preventDefault();
+  drop.classList.remove("dragover");
+  addFiles(e.dataTransfer.files);
+});
+input.addEventListener("change", e => addFiles(e.target.files));
+
+function addFiles(f) {
+  selectedFiles.push(...Array.from(f));
+  names.innerHTML = selectedFiles.map(x => "📄 " + x.name).join("<br>");
+}
+
+/* Upload */
+document.getElementById("upload-btn")
+.addEventListener("click", () => {
+  if (!selectedFiles.length) return showToast("Select files first ⚠️");
+  uploadFiles(selectedFiles);
+});
+
+function uploadFiles(files) {
+  // skip files that can't fit before sending any bytes
+  const remaining = document.getElementById("storage-text").dataset.remaining;
+  if (remaining !== "") {
+    const tooBig = files.filter(f => f.size > Number(remaining));
+    if (tooBig.length) showToast("Not enough storage for " + tooBig.map(f => f.name).join(", ") + " ⚠️");
+    files = files.filter(f => f.size <= Number(remaining));
+    if (!files.length) return;
+  }
+
+  const total = files.length;
+  let uploaded = 0;
+  const p = document.getElementById("upload-progress");
+  const wrap = document.getElementById("progress-wrap");
+  const txt = document.getElementById("progress-text");
+
+  wrap.style.display = "block";
+  p.value = 0;
+
+  files.forEach(file => {
+    const fd = new FormData();
+    fd.append("file", file);
+
+    const xhr = new XMLHttpRequest();
+    xhr.open("POST", `/online/upload/${token}`);
+
+    xhr.onload = () => {
+      if (xhr.status === 413) {
+        showToast("Not enough storage left for " + file.name + " ⚠️");
+        return;
+      }
+      if (xhr.status === 200) {
+        const res = JSON.parse(xhr.responseText);
+        if (res.storage) updateStorage(res.storage);
+        uploaded++;
+        const pct = Math.round((uploaded / total) * 100);
+        p.value = pct;
+        txt.textContent = pct + "%";
+        addFileToList(file.name);
+
+        if (uploaded === total) {
+          showToast("All files uploaded ✔️");
+          wrap.style.display = "none";
+          selectedFiles = [];
+          names.innerHTML = "";
+        }
+      }
+    };
+
+    xhr.send(fd);
+  });
+}
+
+/* Folder upload: the whole folder goes up as one tar in a single request */
+const folderInput = document.getElementById("folder-input");
+document.getElementById("folder-btn").addEventListener("click", () => folderInput.click());
+folderInput.addEventListener("change", e => {
+  const files = Array.from(e.target.files);
+  folderInput.value = "";
+  if (files.length) uploadFolder(files);
+});
+
+const utf8 = new TextEncoder();
+const MAX_USTAR_SIZE = 0o77777777777;
+
+function tarHeader(name, size, type, mtime) {
+  const h = new Uint8Array(512);
+  const put = (str, off, len) => h.set(utf8.encode(str).subarray(0, len), off);
+  const oct = (n, len) => n.toString(8).padStart(len - 1, "0");
+  put(name, 0, 100);
+  put(oct(0o644, 8), 100, 8);
+  put(oct(0, 8), 108, 8);
+  put(oct(0, 8), 116, 8);
+  put(oct(size, 12), 124, 12);
+  put(oct(mtime, 12), 136, 12);
+  put("        ", 148, 8);
+  put(type, 156, 1);
+  put("ustar\0" + "00", 257, 8);
+  const sum = h.reduce((a, b) => a + b, 0);
+  put(sum.toString(8).padStart(6, "0") + "\0 ", 148, 8);
+  return h;
+}
+
+/* PAX record "<len> key=value\n", where len counts its own digits */
+function paxRecord(key, value) {
+  const body = utf8.encode(" " + key + "=" + value + "\n").length;
+  let len = body;
+  while (String(len).length + body !== len) len = String(len).length + body;
+  return len + " " + key + "=" + value + "\n";
+}
+
+/* Lazily built tar: the Blob references the files, nothing is read until it is sent */
+function buildTar(files) {
+  const pad = n => new Uint8Array((512 - n % 512) % 512);
+  const parts = [];
+  files.forEach(file => {
+    const name = file.webkitRelativePath || file.name;
+    const mtime = Math.floor(file.lastModified / 1000);
+    const pax = [];
+    if (!/^[\x20-\x7e]{1,100}$/.test(name)) pax.push(paxRecord("path", name));
+    if (file.size > MAX_USTAR_SIZE) pax.push(paxRecord("size", file.size));
+    if (pax.length) {
+      const ext = utf8.encode(pax.join(""));
+      parts.push(tarHeader("PaxHeader", ext.length, "x", mtime), ext, pad(ext.length));
+    }
+    parts.push(tarHeader(name, file.size > MAX_USTAR_SIZE ? 0 : file.size, "0", mtime), file, pad(file.size));
+  });
+  parts.push(new Uint8Array(1024));
+  return new Blob(parts, { type: "application/x-tar" });
+}
+
+function uploadFolder(files) {
+  const remaining = document.getElementById("storage-text").dataset.remaining;
+  const size = files.reduce((n, f) => n + f.size, 0);
+  if (remaining !== "" && size > Number(remaining)) return showToast("Not enough storage for this folder ⚠️");
+
+  const p = document.getElementById("upload-progress");
+  const wrap = document.getElementById("progress-wrap");
+  const txt = document.getElementById("progress-text");
+  wrap.style.display = "block";
+  p.value = 0;
+
+  const xhr = new XMLHttpRequest();
+  xhr.open("POST", `/online/upload_folder/${token}`);
+  xhr.upload.onprogress = e => {
+    if (!e.lengthComputable) return;
+    const pct = Math.round((e.loaded / e.total) * 100);
+    p.value = pct;
+    txt.textContent = pct + "%";
+  };
+  xhr.onload = () => {
+    wrap.style.display = "none";
+    let res = {};
+    try { res = JSON.parse(xhr.responseText); } catch (err) { /* not JSON, e.g. a login redirect */ }
+    if (res.storage) updateStorage(res.storage);
+    if (res.skipped && res.skipped.length) showToast(res.skipped.length + " entries skipped (links or clashing names) ⚠️");
+    if (xhr.status === 200) showToast(res.saved + " files uploaded ✔️");
+    else if (res.status === "quota_exceeded") showToast("Not enough storage left, " + res.saved + " files uploaded ⚠️");
+    else showToast("Folder upload failed" + (res.status ? " (" + res.status + ")" : "") + " ⚠️");
+  };
+  xhr.onerror = () => {
+    wrap.style.display = "none";
+    showToast("Folder upload failed ⚠️");
+  };
+  xhr.send(buildTar(files));
+}
+
+/* Storage / quota */
+function formatBytes(n) {
+  const units = ["B", "KiB", "MiB", "GiB", "TiB"];
+  let i = 0;
+  while (n >= 1024 && i < units.length - 1) { n /= 1024; i++; }
+  return (i ? n.toFixed(1) : n) + " " + units[i];
+}
+
+function updateStorage(s) {
+  const el = document.getElementById("storage-text");
+  el.dataset.remaining = s.remaining === null ? "" : s.remaining;
+  el.textContent = "Storage: " + formatBytes(s.session_used) + " used" +
+    (s.remaining === null ? "" : " — " + formatBytes(s.remaining) + " free");
+}
+
+/* File list */
+function fileItem(f, uploader) {
+  const li = document.createElement("li");
+  li.dataset.name = f;
+  li.innerHTML =
+    "📄 " + f +
+    ' — <a href="/online/download/' + token + '/' + encodeURIComponent(f) + '" style="color:#00eaff;">Download</a>' +
+    (uploader ? ' <span style="font-size:12px;color:gray;">(' + uploader + ')</span>' : "");
+  return li;
+}
+
+function addFileToList(f) {
+  document.getElementById("file-list").appendChild(fileItem(f));
+}
+
+/* ⭐ FILE ADDED REAL-TIME FIX — one event per file, or one for a whole folder */
+socket.on("file_added", data => {
+  if (!isNewEvent(data)) return;
+  const names = data.filenames || (data.filename ? [data.filename] : []);
+
+  const list = document.getElementById("file-list");
+  const shown = new Set(Array.from(list.children).map(li => li.dataset.name));
+  const batch = document.createDocumentFragment();
+  names.forEach(f => {
+    if (shown.has(f)) return;
+    shown.add(f);
+    batch.appendChild(fileItem(f, data.uploader));
+  });
+  list.appendChild(batch);
+});
+
+/* Participants update */
+function renderParticipants(participants) {
+  const ul = document.getElementById("participants");
+
+  const existing = Array.from(ul.children).map(li => li.textContent);
+  ul.innerHTML = "";
+
+  participants.forEach(p => {
+    const li = document.createElement("li");
+    li.textContent = p;
+
+    if (!existing.includes(p)) li.classList.add("new-join");
+    ul.appendChild(li);
+  });
+
+  document.getElementById("pcount").textContent = participants.length;
+}
+
+socket.on("participants_update", data => {
+  if (!isNewEvent(data)) return;
+  renderParticipants(data.participants);
+});
+
+socket.on("auto_expire_set", data => {
+  if (!isNewEvent(data)) return;
+  showToast("Session will expire in " + data.minutes + "m ⏳");
+  if (document.getElementById('timeout-progress')) startCountdown(data.minutes * 60);
+});
+
+socket.on("session_ended", () => {
+  showToast("Session ended by owner 🛑");
+  setTimeout(() => { window.location = exitUrl; }, 1400);
+});
+
+/* Too much was missed to replay: rebuild from the server's current state */
+socket.on("session_snapshot", data => {
+  document.getElementById("file-list").innerHTML = "";
+  data.files.forEach(addFileToList);
+  renderParticipants(data.participants);
+  lastEventId = data._id || lastEventId;
+});
+
+/* =================== AUTO TIMEOUT RESTORED ===================== */
+document.getElementById('set-timeout')?.addEventListener('click', () => {
+    document.getElementById('timeout-box').style.display = 'block';
+});
+
+document.getElementById('apply-timeout')?.addEventListener('click', async () => {
+    const mins = document.getElementById('timeout-min').value;
+    if (!mins) return showToast("Enter minutes ⏱️");
+
+    const fd = new FormData();
+    fd.append("minutes", mins);
+
+    const res = await fetch('/online/set_auto_expire/' + token, {
+        method: 'POST',
+        body: fd
+    });
+
+    const js = await res.json();
+    if (js.status === 'ok') {
+        showToast("Auto timeout set for " + mins + "m ⏳");
+        startCountdown(mins * 60);
+    }
+});
+
+let timeoutInterval;
+function startCountdown(seconds) {
+    clearInterval(timeoutInterval);
+
+    const bar = document.getElementById('timeout-progress');
+    const inner = document.getElementById('timeout-bar');
+
+    bar.style.display = 'block';
+
+    let remaining = seconds;
+
+    timeoutInterval = setInterval(() => {
+        remaining--;
+        const pct = (remaining / seconds) * 100;
+        inner.style.width = pct + "%";
+
+        if (remaining <= 0) {
+            clearInterval(timeoutInterval);
+            showToast("Session expired ⏳");
+            window.location = exitUrl;
+        }
+    }, 1000);
+}
+
+/* End session */
+document.getElementById("end-btn")?.addEventListener("click", async () => {
+  if (!confirm("End session? Files will be deleted.")) return;
+  const res = await fetch(`/online/end/${token}`, { method: "POST" });
+  const js = await res.json();
+
+  if (js.status === "ended") showToast("Session ended 🛑");
+
+  setTimeout(() => {
+    window.location = exitUrl;
+  }, 1400);
+});
+
+/* Profile menu */
+document.querySelector('.profile-icon')
+.addEventListener('click', () => {
+  document.getElementById('profileMenu').classList.toggle('active');
+});
+document.addEventListener('click', e => {
+  const m = document.getElementById('profileMenu');
+  if (!m.contains(e.target)) m.classList.remove('active');
+});
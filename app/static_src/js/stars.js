@@ -0,0 +1,19 @@
+window.addEventListener("DOMContentLoaded", () => {
+  const stars = document.getElementById("stars");
+  const count = 120;
+  const fragment = document.createDocumentFragment();
+
+  for (let i = 0; i < count; i++) {
+    const star = document.createElement("div");
+    star.classList.add("star");
+    const size = (Math.random() * 2 + 1).toFixed(2);
+    star.style.width = `${size}px`;
+    star.style.height = `${size}px`;
+    star.style.top = `${Math.random() * 100}%`;
+    star.style.left = `${Math.random() * 100}%`;
+    star.style.animationDelay = `${Math.random() * 5}s`;
+    fragment.appendChild(star);
+  }
+
+  stars.appendChild(fragment);
+});
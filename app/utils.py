@@ -1,4 +1,5 @@
-import os
+import os, tempfile
+from contextlib import contextmanager
 from werkzeug.utils import secure_filename
 
 def save_uploaded_file(file, upload_folder):
@@ -11,3 +12,26 @@ def get_user_uploads(upload_folder):
     if not os.path.exists(upload_folder):
         return []
     return os.listdir(upload_folder)
+
+def stored_files(folder):
+    """Sorted names of the files in `folder`, leaving out uploads still being written"""
+    return sorted(f for f in os.listdir(folder) if not f.startswith('.'))
+
+@contextmanager
+def atomic_write(path):
+    """
+    Yield a binary file to write `path` through. It is a temporary file in the
+    same folder that replaces `path` once the block finishes, and is removed if
+    the block fails, so a cut-off upload never leaves half a file. Its name
+    starts with '.', which secure_filename() never produces, so it can't
+    collide with a stored file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            yield out
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,99 @@
+# app/workers.py
+"""
+Per-worker bookkeeping for the multi-process launcher (serve.py).
+
+Every process that serves the app reports a heartbeat to Redis so any worker
+can answer /healthz for the whole pool. When running under serve.py the
+worker also prefixes its Engine.IO session ids with its index, which is what
+the launcher uses to route polling requests back to the worker that owns the
+session.
+"""
+from flask import Blueprint, jsonify, current_app, g
+import redis, os, time, json
+
+from app import socketio
+from app.read_cache import CACHE
+
+workers_bp = Blueprint('workers', __name__)
+
+HEARTBEAT_INTERVAL = 5
+
+WORKER_STATE = {
+    'index': 0,
+    'pid': os.getpid(),
+    'started_at': int(time.time()),
+    'inflight': 0,
+    'requests': 0,
+    'draining': False,
+}
+
+
+def worker_key(index): return f"worker:{index}"
+
+
+def _heartbeat_loop(redis_url):
+    r = redis.Redis.from_url(redis_url)
+    while True:
+        try:
+            state = dict(WORKER_STATE, last_beat=int(time.time()), read_cache=CACHE.stats())
+            r.set(worker_key(state['index']), json.dumps(state), ex=HEARTBEAT_INTERVAL * 3)
+        except Exception as e:
+            print(f"[workers] heartbeat failed: {e}")
+        socketio.sleep(HEARTBEAT_INTERVAL)
+
+
+def drain_worker():
+    """Flag this worker as draining and close its Socket.IO clients so they reconnect elsewhere"""
+    WORKER_STATE['draining'] = True
+    socketio.server.eio.disconnect()
+
+
+def init_worker(app, index):
+    """
+    Mark this process as worker `index`: tag new Engine.IO sids with the index
+    and start publishing heartbeats. Called by serve.py after forking.
+    """
+    WORKER_STATE.update({'index': index, 'pid': os.getpid(), 'started_at': int(time.time())})
+
+    eio = socketio.server.eio
+    generate_id = eio.generate_id
+    eio.generate_id = lambda: f"{index:x}." + generate_id()
+
+    socketio.start_background_task(_heartbeat_loop, app.config['REDIS_URL'])
+
+
+@workers_bp.before_app_request
+def count_request():
+    g.worker_counted = True
+    WORKER_STATE['inflight'] += 1
+    WORKER_STATE['requests'] += 1
+
+
+@workers_bp.teardown_app_request
+def uncount_request(exc):
+    if g.pop('worker_counted', False):
+        WORKER_STATE['inflight'] -= 1
+
+
+@workers_bp.route('/healthz')
+def health():
+    """Report this worker plus every worker with a live heartbeat"""
+    pool = []
+    try:
+        r = redis.Redis.from_url(current_app.config['REDIS_URL'])
+        for key in r.scan_iter(match=worker_key('*')):
+            raw = r.get(key)
+            if raw:
+                pool.append(json.loads(raw))
+        redis_ok = True
+    except Exception:
+        redis_ok = False
+
+    pool.sort(key=lambda w: w['index'])
+    status = 'draining' if WORKER_STATE['draining'] else 'ok'
+    return jsonify({
+        'status': status if redis_ok else 'degraded',
+        'worker': dict(WORKER_STATE, uptime=int(time.time()) - WORKER_STATE['started_at'],
+                       read_cache=CACHE.stats()),
+        'workers': pool,
+    }), 200 if redis_ok and status == 'ok' else 503
@@ -0,0 +1,388 @@
+# serve.py
+"""
+Production launcher: N eventlet workers behind one listening socket.
+
+    python serve.py --workers 16 --port 5000
+    python serve.py --workers 16 --proxy      # behind a reverse proxy
+
+The launcher owns the public socket and accepts every connection itself. It
+peeks at the request line (without consuming it) and hands the connection's
+file descriptor to a worker over a unix socket, so after the hand-off the
+worker talks to the client directly and the launcher never copies bytes.
+
+Workers close each connection after one response (no keep-alive), so every
+request is routed on its own. Routing is sticky for Engine.IO: workers prefix
+their session ids with their index, so a polling or upgrade request carrying
+`sid=<index>.xxx` always goes back to the worker that owns that session.
+/lan/ requests always go to worker 0, since the LAN session lives in process
+memory. Everything else is spread by client address - the peer address, or
+with --proxy the first X-Forwarded-For address, since behind a proxy every
+connection comes from the proxy itself. Socket.IO broadcasts between workers
+travel over the Redis `message_queue`.
+
+SIGTERM / SIGINT drains: the public socket is closed, workers stop accepting,
+disconnect their Socket.IO clients, finish in-flight requests and exit, and
+anything still running after DRAIN_TIMEOUT seconds is killed. Crashed workers
+are restarted. Each worker reports a heartbeat to Redis, see GET /healthz.
+"""
+import os
+import sys
+import time
+import zlib
+import errno
+import signal
+import socket
+import argparse
+import selectors
+import traceback
+from urllib.parse import urlsplit, parse_qs
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "30"))
+HEAD_TIMEOUT = 10          # seconds a client gets to send its request head
+HEAD_RECHECK = 0.05        # seconds between peeks at a partial request head
+LAN_WORKER = 0             # owns the process-local LAN session
+PEEK_BYTES = 4096
+RESTART_BACKOFF = 1.0
+
+
+def forwarded_for(head):
+    """First address in the X-Forwarded-For header of a peeked request head, or None"""
+    for line in head.split(b'\r\n\r\n', 1)[0].split(b'\r\n')[1:]:
+        name, sep, value = line.partition(b':')
+        if sep and name.strip().lower() == b'x-forwarded-for':
+            return value.split(b',')[0].strip().decode('latin-1') or None
+    return None
+
+
+def sid_owner(sid):
+    """Worker index encoded in an Engine.IO sid (see app.workers.init_worker), or None"""
+    prefix, sep, _ = (sid or '').partition('.')
+    if not sep:
+        return None
+    try:
+        return int(prefix, 16)
+    except ValueError:
+        return None
+
+
+# ---------- worker side ----------
+class HandoffListener:
+    """
+    Stands in for a listening socket in eventlet.wsgi.server: accept() returns
+    the connections the launcher passes over `channel`. Raising SystemExit
+    from accept() makes the wsgi server stop and wait for in-flight requests.
+    """
+
+    def __init__(self, channel, family, address):
+        self.channel = channel
+        self.family = family
+        self.address = address
+        self.draining = False
+        channel.setblocking(False)
+
+    def getsockname(self):
+        return self.address
+
+    def accept(self):
+        from eventlet.hubs import trampoline
+        from eventlet.green import socket as green_socket
+
+        while True:
+            if self.draining:
+                raise SystemExit
+            try:
+                msg, fds, _, _ = socket.recv_fds(self.channel, 1, 1)
+            except BlockingIOError:
+                try:
+                    trampoline(self.channel, read=True, timeout=0.5, timeout_exc=socket.timeout)
+                except socket.timeout:
+                    pass
+                continue
+            if not msg:
+                # launcher went away
+                raise SystemExit
+            conn = green_socket.socket(self.family, socket.SOCK_STREAM, fileno=fds[0])
+            try:
+                return conn, conn.getpeername()
+            except OSError:
+                conn.close()
+
+    def close(self):
+        self.channel.close()
+
+
+def run_worker(index, channel, family, address):
+    import eventlet
+    eventlet.monkey_patch()
+    import eventlet.wsgi
+
+    from app import create_app
+    from app.workers import init_worker, drain_worker
+
+    app = create_app()
+    init_worker(app, index)
+    listener = HandoffListener(channel, family, address)
+
+    def on_term(*args):
+        print(f"[worker {index}] draining...")
+        listener.draining = True
+        eventlet.spawn(drain_worker)
+        eventlet.spawn_after(DRAIN_TIMEOUT, os._exit, 0)
+
+    signal.signal(signal.SIGTERM, on_term)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)   # the launcher handles Ctrl+C
+
+    print(f"[worker {index}] pid {os.getpid()} ready")
+    # one request per connection, so the launcher routes every request
+    eventlet.wsgi.server(listener, app, log_output=False, keepalive=False)
+    print(f"[worker {index}] stopped")
+
+
+def prepare():
+    """One-off setup (DB tables) done in a throwaway child so the launcher never imports the app"""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            import eventlet
+            eventlet.monkey_patch()
+            from app import create_app, db
+            app = create_app()
+            with app.app_context():
+                db.create_all()
+        except Exception:
+            traceback.print_exc()
+            os._exit(1)
+        os._exit(0)
+    _, status = os.waitpid(pid, 0)
+    if os.waitstatus_to_exitcode(status) != 0:
+        sys.exit("[server] app setup failed")
+
+
+# ---------- launcher side ----------
+class Worker:
+    def __init__(self, index):
+        self.index = index
+        self.pid = None
+        self.channel = None
+        self.started_at = 0.0
+
+    @property
+    def alive(self):
+        return self.pid is not None
+
+
+class Launcher:
+    def __init__(self, host, port, workers, proxy=False):
+        self.proxy = proxy
+        self.listener = socket.create_server((host, port), backlog=2048)
+        self.listener.setblocking(False)
+        self.address = self.listener.getsockname()
+        self.workers = [Worker(i) for i in range(workers)]
+        self.selector = selectors.DefaultSelector()
+        self.pending = {}      # fd -> (conn, addr, accepted_at)
+        self.parked = {}       # fd -> when to peek again, for pending conns with a partial head
+        self.stopping = False
+
+    # ----- worker processes -----
+    def spawn(self, worker):
+        parent_end, child_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        pid = os.fork()
+        if pid == 0:
+            # child: drop every launcher fd before turning into a worker
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            family = self.listener.family
+            parent_end.close()
+            self.selector.close()
+            self.listener.close()
+            for conn, _, _ in self.pending.values():
+                conn.close()
+            for other in self.workers:
+                if other.channel:
+                    other.channel.close()
+            code = 0
+            try:
+                run_worker(worker.index, child_end, family, self.address)
+            except Exception:
+                traceback.print_exc()
+                code = 1
+            os._exit(code)
+
+        child_end.close()
+        parent_end.setblocking(False)
+        worker.pid, worker.channel, worker.started_at = pid, parent_end, time.time()
+
+    def reap(self):
+        """Collect exited workers and restart them unless we're shutting down"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            for worker in self.workers:
+                if worker.pid != pid:
+                    continue
+                worker.pid = None
+                worker.channel.close()
+                worker.channel = None
+                if not self.stopping:
+                    print(f"[server] worker {worker.index} exited ({os.waitstatus_to_exitcode(status)}), restarting")
+                    if time.time() - worker.started_at < RESTART_BACKOFF:
+                        time.sleep(RESTART_BACKOFF)
+                    self.spawn(worker)
+
+    # ----- routing -----
+    def pick_worker(self, head, addr):
+        """Yield live workers for a connection whose first bytes are `head`, preferred one first"""
+        n = len(self.workers)
+        preferred = None
+        try:
+            target = head.split(b'\r\n', 1)[0].split(b' ')[1].decode('latin-1')
+            url = urlsplit(target)
+            if url.path.startswith('/socket.io'):
+                preferred = sid_owner(parse_qs(url.query).get('sid', [''])[0])
+            elif url.path.startswith('/lan/'):
+                preferred = LAN_WORKER
+        except (IndexError, UnicodeDecodeError):
+            pass
+        if preferred is None or preferred >= n:
+            client = (forwarded_for(head) if self.proxy else None) or addr[0]
+            preferred = zlib.crc32(str(client).encode()) % n
+        for i in range(n):
+            worker = self.workers[(preferred + i) % n]
+            if worker.alive:
+                yield worker
+
+    def dispatch(self, conn, addr, head):
+        for worker in self.pick_worker(head, addr):
+            try:
+                socket.send_fds(worker.channel, [b'c'], [conn.fileno()])
+                break
+            except (BlockingIOError, BrokenPipeError, ConnectionResetError):
+                continue
+        conn.close()
+
+    def on_accept(self):
+        while True:
+            try:
+                conn, addr = self.listener.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                if e.errno in (errno.EMFILE, errno.ENFILE, errno.ECONNABORTED):
+                    return
+                raise
+            conn.setblocking(False)
+            self.pending[conn.fileno()] = (conn, addr, time.time())
+            self.selector.register(conn, selectors.EVENT_READ)
+
+    def on_readable(self, conn):
+        fd = conn.fileno()
+        try:
+            head = conn.recv(PEEK_BYTES, socket.MSG_PEEK)
+        except BlockingIOError:
+            return
+        except OSError:
+            head = b''
+        # the request line is enough, unless we route on X-Forwarded-For
+        needed = b'\r\n\r\n' if self.proxy else b'\r\n'
+        if head and needed not in head and len(head) < PEEK_BYTES:
+            # not complete yet; peeked bytes keep the socket readable, so
+            # take it out of the selector for a while instead of spinning
+            self.selector.unregister(conn)
+            self.parked[fd] = time.time() + HEAD_RECHECK
+            return
+        self.selector.unregister(conn)
+        _, addr, _ = self.pending.pop(fd)
+        if head:
+            self.dispatch(conn, addr, head)
+        else:
+            conn.close()
+
+    def drop_pending(self, fd):
+        conn, _, _ = self.pending.pop(fd)
+        if self.parked.pop(fd, None) is None:
+            self.selector.unregister(conn)
+        conn.close()
+
+    def expire_pending(self):
+        """Drop connections that are too slow to send their head, and wake parked ones"""
+        now = time.time()
+        cutoff = now - HEAD_TIMEOUT
+        for fd, (conn, _, accepted_at) in list(self.pending.items()):
+            if accepted_at < cutoff:
+                self.drop_pending(fd)
+            elif self.parked.get(fd, now + 1) <= now:
+                del self.parked[fd]
+                self.selector.register(conn, selectors.EVENT_READ)
+
+    # ----- lifecycle -----
+    def stop(self, *args):
+        self.stopping = True
+
+    def serve(self):
+        for worker in self.workers:
+            self.spawn(worker)
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.selector.register(self.listener, selectors.EVENT_READ)
+
+        while not self.stopping:
+            for key, _ in self.selector.select(timeout=HEAD_RECHECK if self.parked else 1.0):
+                if key.fileobj is self.listener:
+                    self.on_accept()
+                else:
+                    self.on_readable(key.fileobj)
+            self.expire_pending()
+            self.reap()
+
+        self.drain()
+
+    def drain(self):
+        print("\n[server] Shutting down gracefully...")
+        self.selector.unregister(self.listener)
+        self.listener.close()
+        for fd in list(self.pending):
+            self.drop_pending(fd)
+
+        for worker in self.workers:
+            if worker.alive:
+                os.kill(worker.pid, signal.SIGTERM)
+
+        deadline = time.time() + DRAIN_TIMEOUT + 5
+        while any(w.alive for w in self.workers) and time.time() < deadline:
+            self.reap()
+            time.sleep(0.2)
+
+        for worker in self.workers:
+            if worker.alive:
+                print(f"[server] worker {worker.index} did not drain in time, killing")
+                os.kill(worker.pid, signal.SIGKILL)
+        print("[server] stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run ShieldNet with multiple worker processes")
+    parser.add_argument('--host', default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument('--port', type=int, default=int(os.getenv("PORT", "5000")))
+    parser.add_argument('--workers', type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument('--proxy', action='store_true', default=os.getenv("BEHIND_PROXY") == "1",
+                        help="route by X-Forwarded-For (only behind a trusted reverse proxy)")
+    args = parser.parse_args()
+
+    sys.stdout.reconfigure(line_buffering=True)   # workers exit via os._exit
+    prepare()
+    launcher = Launcher(args.host, args.port, max(1, args.workers), proxy=args.proxy)
+    print(f"[server] Secure Transfer Server on http://{args.host}:{args.port} with {args.workers} workers")
+    launcher.serve()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# tests/conftest.py
+"""
+Shared fixtures. Redis is replaced with fakeredis (its Lua support needs
+`lupa`), so the quota scripts run for real without a server:
+
+    pip install pytest fakeredis lupa
+    python -m pytest -q
+"""
+import os, sys, io, tarfile, functools
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+    import app as package
+    from app import create_app, db, socketio
+    from app.models import User
+
+    # broadcasts stay in process instead of going through a Redis message queue
+    socketio.server_options.pop('message_queue', None)
+    workdir = tmp_path_factory.mktemp('shieldnet')
+    # the database and template cache live in the instance folder: keep them out of the tree
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(package, 'Flask', functools.partial(package.Flask, instance_path=str(workdir)))
+        app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, UPLOAD_FOLDER=str(workdir / 'uploads'))
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username='alice', email='alice@example.com', password='x'))
+        db.session.commit()
+    return app
+
+
+@pytest.fixture
+def redis_db(app, monkeypatch):
+    import fakeredis
+    import app.online_transfer as online_transfer
+
+    r = fakeredis.FakeRedis()
+    monkeypatch.setattr(online_transfer, 'get_redis', lambda: r)
+    return r
+
+
+@pytest.fixture
+def client(app, redis_db):
+    c = app.test_client()
+    with c.session_transaction() as sess:
+        sess['_user_id'] = '1'
+        sess['_fresh'] = True
+    return c
+
+
+@pytest.fixture
+def make_session(client, redis_db):
+    """Create an online session as alice and return its token"""
+    def create(encrypt=False):
+        before = set(redis_db.keys('session:*'))
+        client.post('/online/create', data={'session_name': 'test', 'encrypt': '1' if encrypt else ''})
+        (key,) = [k for k in set(redis_db.keys('session:*')) - before if k.count(b':') == 1]
+        return key.decode().split(':', 1)[1]
+    return create
+
+
+def make_tar(entries):
+    """
+    Tar archive bytes from (name, data) pairs. data=None adds a directory and
+    a str adds a symlink pointing at it.
+    """
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w') as tar:
+        for name, data in entries:
+            info = tarfile.TarInfo(name)
+            if data is None:
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            elif isinstance(data, str):
+                info.type = tarfile.SYMTYPE
+                info.linkname = data
+                tar.addfile(info)
+            else:
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
@@ -0,0 +1,128 @@
+# tests/test_encryption.py
+import io, os
+
+import pytest
+
+pytest.importorskip('cryptography')
+
+from app.encryption import (HEADER, TAG_SIZE, EncryptedFileError, encrypt_stream, encrypted_size,
+                            generate_key, iter_decrypted, plaintext_size)
+
+CHUNK = 16      # small records so a few bytes span several of them
+RECORD = CHUNK + TAG_SIZE
+
+
+def encrypt(tmp_path, data, key, name='file.bin'):
+    path = str(tmp_path / name)
+    assert encrypt_stream(io.BytesIO(data), path, key, chunk_size=CHUNK) == len(data)
+    return path
+
+
+def decrypt(path, key, start=0, stop=None):
+    return b''.join(iter_decrypted(path, key, start, stop))
+
+
+def records(path):
+    with open(path, 'rb') as fh:
+        raw = fh.read()
+    body = raw[HEADER.size:]
+    return raw[:HEADER.size], [body[i:i + RECORD] for i in range(0, len(body), RECORD)]
+
+
+def write(path, header, parts):
+    with open(path, 'wb') as fh:
+        fh.write(header + b''.join(parts))
+
+
+@pytest.mark.parametrize('size', [0, 1, CHUNK - 1, CHUNK, CHUNK + 1, 5 * CHUNK, 5 * CHUNK + 7])
+def test_round_trip_and_size(tmp_path, size):
+    key = generate_key()
+    data = os.urandom(size)
+    path = encrypt(tmp_path, data, key)
+    assert os.path.getsize(path) == encrypted_size(size, chunk_size=CHUNK)
+    assert plaintext_size(path) == size
+    assert decrypt(path, key) == data
+
+
+def test_empty_file_is_one_authenticated_record(tmp_path):
+    key = generate_key()
+    path = encrypt(tmp_path, b'', key)
+    header, parts = records(path)
+    assert [len(p) for p in parts] == [TAG_SIZE]
+    assert decrypt(path, key) == b''
+    write(path, header, [])
+    with pytest.raises(EncryptedFileError):
+        decrypt(path, key)
+
+
+@pytest.mark.parametrize('start, stop', [
+    (0, CHUNK), (CHUNK - 1, CHUNK + 1), (CHUNK, 2 * CHUNK), (2 * CHUNK - 1, 2 * CHUNK),
+    (3 * CHUNK, None), (5 * CHUNK, 5 * CHUNK + 7), (5 * CHUNK + 6, None), (7, 7), (0, 10 ** 6),
+])
+def test_ranges_across_record_boundaries(tmp_path, start, stop):
+    key = generate_key()
+    data = os.urandom(5 * CHUNK + 7)
+    path = encrypt(tmp_path, data, key)
+    assert decrypt(path, key, start, stop) == data[start:stop]
+
+
+def test_wrong_key_is_rejected(tmp_path):
+    path = encrypt(tmp_path, b'secret' * 10, generate_key())
+    with pytest.raises(EncryptedFileError):
+        decrypt(path, generate_key())
+
+
+def test_dropping_the_final_record_is_detected(tmp_path):
+    key = generate_key()
+    path = encrypt(tmp_path, os.urandom(3 * CHUNK), key)
+    header, parts = records(path)
+    write(path, header, parts[:-1])
+    with pytest.raises(EncryptedFileError):
+        decrypt(path, key)
+
+
+def test_cutting_a_record_short_is_detected(tmp_path):
+    key = generate_key()
+    path = encrypt(tmp_path, os.urandom(3 * CHUNK), key)
+    header, parts = records(path)
+    write(path, header, parts[:-1] + [parts[-1][:-1]])
+    with pytest.raises(EncryptedFileError):
+        decrypt(path, key)
+
+
+def test_reordered_records_are_detected(tmp_path):
+    key = generate_key()
+    path = encrypt(tmp_path, os.urandom(3 * CHUNK), key)
+    header, parts = records(path)
+    write(path, header, [parts[1], parts[0], parts[2]])
+    with pytest.raises(EncryptedFileError):
+        decrypt(path, key, 0, CHUNK)
+
+
+def test_records_from_another_file_are_detected(tmp_path):
+    key = generate_key()
+    a = encrypt(tmp_path, os.urandom(3 * CHUNK), key, 'a.bin')
+    b = encrypt(tmp_path, os.urandom(3 * CHUNK), key, 'b.bin')
+    header_a, parts_a = records(a)
+    _, parts_b = records(b)
+    write(a, header_a, [parts_a[0], parts_b[1], parts_a[2]])
+    with pytest.raises(EncryptedFileError):
+        decrypt(a, key, CHUNK, 2 * CHUNK)
+
+
+def test_not_an_encrypted_file(tmp_path):
+    path = tmp_path / 'plain.txt'
+    path.write_bytes(b'just some plaintext that is long enough')
+    with pytest.raises(EncryptedFileError):
+        plaintext_size(str(path))
+
+
+def test_failed_write_leaves_no_file(tmp_path):
+    class Broken(io.RawIOBase):
+        def readinto(self, b):
+            raise OSError("connection reset")
+
+    path = tmp_path / 'file.bin'
+    with pytest.raises(OSError):
+        encrypt_stream(Broken(), str(path), generate_key(), chunk_size=CHUNK)
+    assert list(tmp_path.iterdir()) == []
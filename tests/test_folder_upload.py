@@ -0,0 +1,105 @@
+# tests/test_folder_upload.py
+import os
+
+import pytest
+
+from conftest import make_tar
+
+
+def upload(client, token, entries):
+    return client.post(f'/online/upload_folder/{token}', data=make_tar(entries),
+                       headers={'Content-Type': 'application/x-tar'})
+
+
+def stored(redis_db, token):
+    return [f.decode() for f in redis_db.lrange(f'session:{token}:files', 0, -1)]
+
+
+def download(client, token, name):
+    rv = client.get(f'/online/download/{token}/{name}')
+    assert rv.status_code == 200, name
+    return rv.data
+
+
+@pytest.mark.parametrize('encrypt', [False, True])
+def test_files_are_extracted_and_registered(client, redis_db, make_session, encrypt):
+    token = make_session(encrypt=encrypt)
+    rv = upload(client, token, [('proj', None), ('proj/src', None),
+                                ('proj/src/main.py', b'print(1)\n'), ('proj/empty.txt', b'')])
+    assert rv.status_code == 200
+    assert rv.get_json()['saved'] == 2
+    assert stored(redis_db, token) == ['proj/src/main.py', 'proj/empty.txt']
+    assert download(client, token, 'proj/src/main.py') == b'print(1)\n'
+    assert download(client, token, 'proj/empty.txt') == b''
+
+
+@pytest.mark.parametrize('name', ['../escape.txt', 'a/../../escape.txt', '/etc/cron.d/x', '\\windows\\x'])
+def test_traversal_and_absolute_names_are_rejected(app, client, redis_db, make_session, name):
+    token = make_session()
+    rv = upload(client, token, [(name, b'evil')])
+    assert rv.status_code == 400
+    assert rv.get_json()['status'] == 'bad_entry'
+    assert stored(redis_db, token) == []
+    assert not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], 'escape.txt'))
+
+
+def test_links_are_skipped_and_reported(client, redis_db, make_session):
+    token = make_session()
+    rv = upload(client, token, [('passwd', '/etc/passwd'), ('ok.txt', b'ok')])
+    body = rv.get_json()
+    assert rv.status_code == 200
+    assert body['skipped'] == [{'name': 'passwd', 'reason': 'not_a_file'}]
+    assert stored(redis_db, token) == ['ok.txt']
+
+
+def test_clashing_names_keep_the_first_entry(client, redis_db, make_session):
+    token = make_session()
+    rv = upload(client, token, [('a b.txt', b'first'), ('a_b.txt', b'second')])
+    body = rv.get_json()
+    assert rv.status_code == 200
+    assert body['skipped'] == [{'name': 'a_b.txt', 'reason': 'name_clash', 'stored_as': 'a_b.txt'}]
+    assert download(client, token, 'a_b.txt') == b'first'
+
+
+def test_non_ascii_names_get_a_stable_fallback(client, redis_db, make_session):
+    token = make_session()
+    rv = upload(client, token, [('文件/说明.txt', b'hello'), ('ok.txt', b'ok')])
+    assert rv.status_code == 200
+    (name, ok) = stored(redis_db, token)
+    folder, base = name.split('/')
+    assert ok == 'ok.txt' and len(folder) == 12 and base.endswith('.txt')
+    assert download(client, token, name) == b'hello'
+
+
+def test_an_entry_named_like_a_temp_file_survives(client, redis_db, make_session):
+    token = make_session()
+    rv = upload(client, token, [('d/movie.mkv.part', b'part'), ('d/movie.mkv', b'movie')])
+    assert rv.status_code == 200
+    assert download(client, token, 'd/movie.mkv.part') == b'part'
+    assert download(client, token, 'd/movie.mkv') == b'movie'
+
+
+def test_quota_stops_the_archive_midway(app, client, redis_db, make_session, monkeypatch):
+    import app.online_transfer as online_transfer
+
+    monkeypatch.setitem(app.config, 'SESSION_QUOTA_BYTES', 2500)
+    monkeypatch.setattr(online_transfer, 'FOLDER_RESERVE_STEP', 1)
+    token = make_session()
+    rv = upload(client, token, [(f'f{i}.bin', b'x' * 1000) for i in range(4)])
+    body = rv.get_json()
+    assert rv.status_code == 413
+    assert body['status'] == 'quota_exceeded' and body['saved'] == 2
+    # what was written stays registered, and only that is counted
+    assert stored(redis_db, token) == ['f0.bin', 'f1.bin']
+    assert int(redis_db.get(f'quota:session:{token}')) == 2000
+    assert not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], token, 'f2.bin'))
+
+
+def test_a_truncated_archive_keeps_what_arrived(client, redis_db, make_session):
+    token = make_session()
+    data = make_tar([('a.txt', b'a' * 100), ('b.txt', b'b' * 5000)])
+    rv = client.post(f'/online/upload_folder/{token}', data=data[:2048],
+                     headers={'Content-Type': 'application/x-tar'})
+    assert rv.status_code == 400
+    assert rv.get_json()['status'] == 'bad_archive'
+    assert stored(redis_db, token) == ['a.txt']